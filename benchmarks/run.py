@@ -0,0 +1,95 @@
+"""
+Run the clickutil benchmarks, optionally saving the results as a baseline
+or comparing them against a saved one.
+
+Run with `make bench` (or `python benchmarks/run.py --help`) after
+`make dev-install`. It exits with status 1 if any benchmark regressed, so
+it can gate a release or CI job.
+
+`baseline.json` is a reference baseline, committed so that there is always
+something to compare against. Timings depend on the machine, so before
+comparing a change, save a baseline of the unchanged code on your machine
+with `make bench-baseline` (and don't commit it unless it replaces the
+reference, e.g. for a release).
+"""
+from __future__ import print_function
+
+import json
+import os
+import sys
+
+import click
+
+import clickutil
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from suite import BENCHMARKS  # noqa: E402
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'baseline.json')
+
+
+def run(baseline=DEFAULT_BASELINE, save=False, threshold=0.2, only=()):
+    """
+    Run the benchmarks, print a report, and return the number of
+    regressions of more than `threshold` (as a fraction) against the
+    `baseline` file, if it exists. If `save`, write the results to
+    `baseline`.
+
+    """
+    previous = {}
+    if os.path.exists(baseline):
+        with open(baseline) as f:
+            previous = json.load(f)
+
+    results = {}
+    regressions = 0
+    click.echo('%-28s %12s %12s %9s' % ('benchmark', 'time', 'baseline',
+                                         'change'))
+    for name, bench in BENCHMARKS.items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        results[name] = seconds = bench()
+        line = '%-28s %12s' % (name, _format_seconds(seconds))
+        if name in previous:
+            change = seconds / previous[name] - 1
+            line += ' %12s %+8.1f%%' % (_format_seconds(previous[name]),
+                                        100 * change)
+            if change > threshold:
+                line += '  REGRESSION'
+                regressions += 1
+        click.echo(line)
+
+    if save:
+        previous.update(results)
+        with open(baseline, 'w') as f:
+            json.dump(previous, f, indent=2, sort_keys=True)
+        click.echo('saved baseline to %s' % baseline)
+    return regressions
+
+
+def _format_seconds(seconds):
+    for unit, scale in [('s', 1), ('ms', 1e3), ('us', 1e6)]:
+        if seconds * scale >= 1:
+            return '%.2f %s' % (seconds * scale, unit)
+    return '%.1f ns' % (seconds * 1e9)
+
+
+@click.command('run-benchmarks')
+@clickutil.option('--baseline', None, clickutil.NEW_FILE_OR_DIR,
+                  'baseline file to compare against')
+@clickutil.boolean('--save', 'save the results to the baseline file?')
+@clickutil.option('--threshold', None, float,
+                  'relative slowdown counted as a regression')
+@clickutil.option('--only', None, {'multiple': True, 'type': str},
+                  'only run benchmarks whose names contain this')
+@clickutil.use_output(run)
+def _run(regressions):
+    if regressions:
+        click.echo('%d regression(s)' % regressions, err=True)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    _run()
@@ -0,0 +1,147 @@
+"""
+Benchmarks for clickutil's decorator stack.
+
+Each benchmark is a function registered with `@benchmark`, which returns
+the best observed time in seconds for one operation.
+"""
+from __future__ import print_function
+
+import subprocess
+import sys
+import timeit
+from collections import OrderedDict
+
+import click
+
+import clickutil
+
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    def decorator(f):
+        BENCHMARKS[name] = f
+        return f
+    return decorator
+
+
+def best_of(f, number, repeat=5):
+    return min(timeit.repeat(f, number=number, repeat=repeat)) / number
+
+
+def best_of_subprocess(code, repeat=10):
+    timer = ('import time, subprocess, sys; t = time.perf_counter(); '
+             'subprocess.check_call([sys.executable, "-c", %r]); '
+             'print(time.perf_counter() - t)' % code)
+    return min(float(subprocess.check_output([sys.executable, '-c', timer]))
+               for _ in range(repeat))
+
+
+# import time
+
+@benchmark('import/python')
+def bench_import_python():
+    return best_of_subprocess('pass')
+
+
+@benchmark('import/clickutil')
+def bench_import_clickutil():
+    return best_of_subprocess('import clickutil')
+
+
+# `debug` only imports tdx for `--debug` runs, so time both
+
+@benchmark('import/clickutil+debug-off')
+def bench_import_clickutil_debug_off():
+    return best_of_subprocess('import clickutil; clickutil.debug()'
+                              '(lambda x: x)(debug=False, x=1)')
+
+
+@benchmark('import/clickutil+debug-on')
+def bench_import_clickutil_debug_on():
+    return best_of_subprocess('import clickutil; clickutil.debug()'
+                              '(lambda x: x)(debug=True, x=1)')
+
+
+# decoration time
+
+def make_target(n_options):
+    args = ', '.join('option_%d=%d' % (i, i) for i in range(n_options))
+    flags = ', '.join('flag_%d=False' % i for i in range(n_options))
+    namespace = {}
+    exec('def f(%s, %s): return %d' % (args, flags, n_options), namespace)
+    return namespace['f']
+
+
+def decorate(f, n_options):
+    placeholder = clickutil.call(f)(lambda: None)
+    for i in range(n_options):
+        placeholder = clickutil.option('--option-%d' % i, None, int,
+                                       'option %d' % i)(placeholder)
+        placeholder = clickutil.boolean('--flag-%d' % i,
+                                        'flag %d' % i)(placeholder)
+    return click.command('f')(clickutil.debug()(placeholder))
+
+
+for _n in (1, 10, 50):
+    def _bench_decorate(n=_n):
+        f = make_target(n)
+        return best_of(lambda: decorate(f, n), number=20)
+    benchmark('decorate/%d-options' % _n)(_bench_decorate)
+
+
+# per-call overhead
+
+def add(x, y=1):
+    return x + y
+
+
+def printer(output):
+    pass
+
+
+def make_callers():
+    @clickutil.call(add)
+    def _call(): pass
+
+    @clickutil.call(add, fast=True)
+    def _call_fast(): pass
+
+    @clickutil.use_output(add)
+    def _use_output(output):
+        printer(output)
+
+    @clickutil.use_output(add, fast=True)
+    def _use_output_fast(output):
+        printer(output)
+
+    @clickutil.debug()
+    @clickutil.call(add)
+    def _debug_call(): pass
+
+    return [
+        ('call/direct', lambda: add(1, y=2)),
+        ('call/call', lambda: _call(1, y=2)),
+        ('call/call-fast', lambda: _call_fast(1, y=2)),
+        ('call/use_output', lambda: _use_output(1, y=2)),
+        ('call/use_output-fast', lambda: _use_output_fast(1, y=2)),
+        ('call/debug+call', lambda: _debug_call(x=1, y=2, debug=False)),
+    ]
+
+
+for _name, _f in make_callers():
+    benchmark(_name)(lambda f=_f: best_of(f, number=100000))
+
+
+# --help rendering
+
+for _n in (10, 50):
+    def _bench_help(n=_n):
+        command = decorate(make_target(n), n)
+
+        def render():
+            with command.make_context('f', [], resilient_parsing=True) as ctx:
+                command.get_help(ctx)
+        return best_of(render, number=20)
+    benchmark('help/%d-options' % _n)(_bench_help)
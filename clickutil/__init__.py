@@ -1,11 +1,85 @@
+"""
+clickutil imports its submodules lazily: `import clickutil` loads almost
+nothing, and each public name is imported from its submodule the first time
+it is used, so a command only pays for the parts of clickutil it uses.
+
+"""
+import importlib
+import sys
+import types
+
 from .version import __version__
 
-from . import args
-from . import call
-from . import debug
-from . import command
 
-from .args import *
-from .call import *
-from .debug import *
-from .command import *
+# the public names of each submodule
+_SUBMODULE_EXPORTS = [
+    ('argspec', ['with_argspec', 'update_wrapper', 'wraps', 'get_argspec']),
+    ('util', ['mk_decorator', 'wraps_command']),
+    ('args', ['EXISTING_FILE', 'EXISTING_DIR', 'NEW_FILE_OR_DIR',
+              'default_option', 'required_option', 'boolean_flag', 'option',
+              'boolean', 'get_arg_default']),
+    ('call', ['call', 'use_output']),
+    ('debug', ['debug', 'crash_dump', 'install_crash_dump']),
+    ('command', ['command', 'lazy_group', 'LazyGroup']),
+    ('batch', ['batch']),
+    ('parallel', ['EXECUTORS', 'JobSettings', 'jobs', 'get_job_settings',
+                  'map_option', 'MapError', 'run_parallel']),
+    ('profile', ['profile', 'sample_profile', 'memprofile']),
+    ('timing', ['Timings', 'timings']),
+    ('server', ['serve', 'zygote', 'connect']),
+    ('manifest', ['MANIFEST_VERSION', 'build_manifest', 'write_manifest',
+                  'load_manifest', 'manifest_command', 'ManifestCommand']),
+    ('completion', ['ScandirPath', 'scandir_candidates', 'cached_completion']),
+    ('aio', ['set_loop_factory', 'is_async', 'run_async', 'iterate_async',
+             'sync_invoker', 'fan_out']),
+    ('files', ['MappedFile', 'MAPPED_FILE', 'map_file', 'close_view',
+               'DEFAULT_BUFFER_SIZE', 'InputStream', 'INPUT_STREAM',
+               'open_input', 'DEFAULT_RANGE_BYTES', 'map_lines',
+               'line_ranges']),
+    ('sharding', ['sharded', 'in_shard', 'shard_of']),
+    ('cache', ['DEFAULT_MAX_BYTES', 'cached', 'cached_call',
+               'incremental']),
+]
+
+_EXPORTS = dict((name, submodule)
+                for submodule, names in _SUBMODULE_EXPORTS
+                for name in names)
+
+_SUBMODULES = set(submodule for submodule, _ in _SUBMODULE_EXPORTS)
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        submodule = importlib.import_module('.' + _EXPORTS[name], __name__)
+        value = getattr(submodule, name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError('module %r has no attribute %r'
+                             % (__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS) | _SUBMODULES)
+
+
+class _Package(types.ModuleType):
+    """
+    The import system sets each submodule as an attribute of the package
+    when it is first imported. Some submodules are named after the function
+    they export (`clickutil.debug`, `clickutil.call`, ...), and there the
+    function must win, so we ignore those assignments.
+
+    """
+
+    def __setattr__(self, name, value):
+        if isinstance(value, types.ModuleType) and name in _EXPORTS:
+            return
+        super(_Package, self).__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
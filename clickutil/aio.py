@@ -0,0 +1,207 @@
+"""
+Run coroutine functions and async generators from synchronous click
+commands.
+
+`call` and `use_output` accept async targets directly: a coroutine is run
+to completion on a new event loop, and an async iterator is turned into an
+ordinary iterator which steps the loop for each item, so `use_output`
+printers (streaming or not) get the items as they arrive. Event loops come
+from the loop factory set with `set_loop_factory`, for example
+`uvloop.new_event_loop`.
+
+asyncio is only imported once an async target actually runs.
+
+"""
+import inspect
+
+from .argspec import update_wrapper
+
+
+_loop_factory = None
+
+
+def set_loop_factory(loop_factory):
+    """
+    Set the function used to create event loops for async targets, for
+    example `uvloop.new_event_loop`. None restores the default,
+    `asyncio.new_event_loop`.
+
+    """
+    global _loop_factory
+    _loop_factory = loop_factory
+
+
+def is_async(f):
+    """
+    Return whether `f`, or the function it wraps, is a coroutine function
+    or an async generator function.
+
+    """
+    for candidate in (f, inspect.unwrap(f)):
+        if (inspect.iscoroutinefunction(candidate) or
+                inspect.isasyncgenfunction(candidate)):
+            return True
+    return False
+
+
+def run_async(awaitable, loop_factory=None):
+    """
+    Run `awaitable` to completion on a new event loop, and return its
+    result. The loop is never made the current event loop, so any loop
+    the caller has set stays current. Raises RuntimeError if called from
+    a running event loop, where `awaitable` should be awaited instead.
+
+    PARAMETERS
+    ----------
+    awaitable : awaitable
+        For example, the result of calling a coroutine function.
+    loop_factory : {function, None}
+        Creates the event loop. Defaults to the one set with
+        `set_loop_factory`.
+
+    """
+    try:
+        loop = _new_loop(loop_factory)
+    except RuntimeError:
+        if inspect.iscoroutine(awaitable):
+            # it will never run, so don't warn that it wasn't awaited
+            awaitable.close()
+        raise
+    try:
+        return loop.run_until_complete(awaitable)
+    finally:
+        _close_loop(loop)
+
+
+def iterate_async(aiterable, loop_factory=None):
+    """
+    Return an iterator over the items of the async iterable `aiterable`,
+    which runs a new event loop until each item arrives.
+
+    PARAMETERS
+    ----------
+    aiterable : async iterable
+        For example, the result of calling an async generator function.
+    loop_factory : {function, None}
+        See `run_async`.
+
+    """
+    aiterator = aiterable.__aiter__()
+    loop = _new_loop(loop_factory)
+    try:
+        while True:
+            try:
+                item = loop.run_until_complete(aiterator.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        try:
+            if hasattr(aiterator, 'aclose'):
+                loop.run_until_complete(aiterator.aclose())
+        finally:
+            _close_loop(loop)
+
+
+def sync_invoker(target, loop_factory=None):
+    """
+    Return a function which calls `target` and, if it is async, runs its
+    result with `run_async` or `iterate_async`. Sync targets are returned
+    unchanged, so they pay nothing.
+
+    """
+    if not is_async(target):
+        return target
+
+    def invoke(*args, **kwargs):
+        result = target(*args, **kwargs)
+        if inspect.isawaitable(result):
+            return run_async(result, loop_factory)
+        if hasattr(result, '__anext__'):
+            return iterate_async(result, loop_factory)
+        return result
+
+    return invoke
+
+
+def fan_out(target, arg, concurrency=10):
+    """
+    Turn the coroutine function `target` into one which takes a list of
+    values for its argument `arg`, awaits `target` once per value with at
+    most `concurrency` calls in flight, and returns the list of results in
+    the order of the values. If any call raises, the rest are cancelled
+    and the error is re-raised.
+
+    The result keeps the argspec of `target`, so it can be used with
+    `call` and `use_output`, with `arg` declared as a `multiple` option.
+
+    PARAMETERS
+    ----------
+    target : coroutine function
+        The function to await per value.
+    arg : str
+        The name of the argument of `target` to fan out over.
+    concurrency : int
+        The maximum number of calls awaited at once.
+
+    EXAMPLE
+    -------
+
+    >>> @click.command('fetch')
+    >>> @clickutil.option('--url', None, {'multiple': True, 'type': str},
+                          'urls to fetch')
+    >>> @clickutil.use_output(clickutil.fan_out(fetch, 'url', 20))
+    >>> def _fetch(pages):
+            for page in pages:
+                click.echo(page)
+
+    """
+    signature = inspect.signature(target)
+
+    async def wrapper(*args, **kwargs):
+        import asyncio
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        values = list(bound.arguments[arg])
+        results = [None] * len(values)
+        indices = iter(range(len(values)))
+
+        async def worker():
+            for i in indices:
+                bound.arguments[arg] = values[i]
+                call_args, call_kwargs = bound.args, bound.kwargs
+                results[i] = await target(*call_args, **call_kwargs)
+
+        workers = [asyncio.ensure_future(worker())
+                   for _ in range(min(concurrency, len(values)))]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for future in workers:
+                future.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+        return results
+
+    update_wrapper(wrapper, target)
+    return wrapper
+
+
+def _new_loop(loop_factory):
+    import asyncio
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        raise RuntimeError('clickutil cannot run an async target from inside '
+                           'a running event loop; await it instead')
+    return (loop_factory or _loop_factory or asyncio.new_event_loop)()
+
+
+def _close_loop(loop):
+    try:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.run_until_complete(loop.shutdown_default_executor())
+    finally:
+        loop.close()
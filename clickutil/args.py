@@ -1,11 +1,12 @@
 import click
 
 from .argspec import get_argspec
+from .completion import CompletingOption, ScandirPath
 from .util import mk_decorator
 
 
-EXISTING_FILE = click.Path(exists=True, dir_okay=False, file_okay=True)
-EXISTING_DIR = click.Path(exists=True, dir_okay=True, file_okay=False)
+EXISTING_FILE = ScandirPath(exists=True, dir_okay=False, file_okay=True)
+EXISTING_DIR = ScandirPath(exists=True, dir_okay=True, file_okay=False)
 NEW_FILE_OR_DIR = click.Path(exists=False)
 
 
@@ -97,7 +98,9 @@ def option(flag, short_flag, type, help):
 
     The `type` entry must be one of either:
       - a valid click type
-      - a dict with a 'type' entry and an optional 'multiple' entry
+      - a dict with a 'type' entry and optional 'multiple' and 'complete'
+        entries, where 'complete' is a click `shell_complete` callback
+        such as one made by `clickutil.cached_completion`
 
     For example `type` could be:
       - `click.Choice(['choice_a', 'choice_b'])`
@@ -163,10 +166,11 @@ def get_arg_default(f, varname):
         But many third-party decorators, including those from `click`,
         clobber the required metadata.
     varname : str
-        A variable name. Must be one of the regular arguments of `f` (not
-        varargs or packed keywordargs), or else `f` must take a packed
-        keyword argument. In the latter case, we treat all arguments which
-        don't correspond to regular arguments as having no default value.
+        A variable name. Must be one of the regular or keyword-only
+        arguments of `f` (not varargs or packed keywordargs), or else `f`
+        must take a packed keyword argument. In the latter case, we treat
+        all arguments which don't correspond to regular arguments as
+        having no default value.
 
     RETURNS
     -------
@@ -177,21 +181,14 @@ def get_arg_default(f, varname):
 
     """
     f_argspec = get_argspec(f)
-    if varname not in f_argspec.args:
-        if f_argspec.keywords is None:
-            raise ValueError('Variable %r not found in spec of func %s'
-                             % (varname, f.__name__))
-        return (False, None)
-    # args and defaults of an argspec are both in the order given. Since
-    # we don't really care about the order, the easiest way to line them
-    # up is to reverse them
-    if f_argspec.defaults is None:
-        return (False, None)
-    varidx = f_argspec.args[::-1].index(varname)
-    if varidx < len(f_argspec.defaults):
-        return (True, f_argspec.defaults[::-1][varidx])
-    else:
+    if varname in f_argspec.arg_defaults:
+        return (True, f_argspec.arg_defaults[varname])
+    if varname in f_argspec.args or varname in f_argspec.kwonlyargs:
         return (False, None)
+    if f_argspec.keywords is None:
+        raise ValueError('Variable %r not found in spec of func %s'
+                         % (varname, f.__name__))
+    return (False, None)
 
 
 def _parse_type(type, help):
@@ -208,6 +205,9 @@ def _parse_type(type, help):
     if isinstance(type, dict):
         type_info = {'multiple': type.get('multiple', False),
                      'type': type.get('type')}
+        if 'complete' in type:
+            type_info['shell_complete'] = type['complete']
+            type_info['cls'] = CompletingOption
     else:
         type_info = {'multiple': False,
                      'type': type}
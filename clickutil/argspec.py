@@ -9,19 +9,42 @@ since the output of a `click` decorator isn't a wrapper function but rather
 an object.
 
 So this module avoids the issue by finding a function's argspec using
-`inspect.getargspe`, and attaching it as metadata under the `__argspec__`
+`inspect.signature`, and attaching it as metadata under the `__argspec__`
 key (which isn't a traditional key for python object). This suffices for
 the purposes of clickutil.
 
+Argspecs are computed once per function and cached, since a single command
+with many `clickutil.option` decorators asks for the same argspec once per
+decorator.
+
 """
+import collections
 import functools
 import inspect
+import weakref
 
 
 WRAPPER_ASSIGNMENTS = functools.WRAPPER_ASSIGNMENTS
 WRAPPER_UPDATES = functools.WRAPPER_UPDATES
 
 
+ArgSpec = collections.namedtuple('ArgSpec', [
+    'args', 'varargs', 'keywords', 'defaults', 'kwonlyargs', 'arg_defaults',
+])
+ArgSpec.__doc__ = """
+Precomputed argument information for a function.
+
+The first four fields match the old `inspect.getargspec` output. In
+addition, `kwonlyargs` lists the keyword-only arguments and `arg_defaults`
+maps every argument that has a default value (including keyword-only ones)
+to that default.
+
+"""
+
+
+_ARGSPEC_CACHE = weakref.WeakKeyDictionary()
+
+
 def with_argspec(f):
     """
     Create a decorated version of `f` whose `__argspec__` field is
@@ -111,7 +134,10 @@ def wraps(wrapped,
 def get_argspec(f):
     """
     If `f` has an `__argspec__` field, return it. Otherwise,
-    return `inspec.getargspec(f)`.
+    return an `ArgSpec` computed from `inspect.signature(f)`.
+
+    The computed `ArgSpec` is cached (weakly keyed on `f`), so repeated
+    calls for the same function only introspect it once.
 
     PARAMETERS
     ----------
@@ -132,5 +158,43 @@ def get_argspec(f):
     """
     if hasattr(f, '__argspec__'):
         return getattr(f, '__argspec__')
-    else:
-        return inspect.getargspec(f)
+    try:
+        return _ARGSPEC_CACHE[f]
+    except KeyError:
+        argspec = _ARGSPEC_CACHE[f] = _compute_argspec(f)
+        return argspec
+    except TypeError:
+        # not hashable or not weak-referenceable, so we can't cache it
+        return _compute_argspec(f)
+
+
+def _compute_argspec(f):
+    """
+    Build an `ArgSpec` for `f` from `inspect.signature`. We don't follow
+    `__wrapped__`, because a decorator built with `functools.wraps` really
+    has lost its target's arguments as far as callers are concerned.
+
+    """
+    args = []
+    varargs = None
+    keywords = None
+    kwonlyargs = []
+    arg_defaults = {}
+    defaults = []
+    parameters = inspect.signature(f, follow_wrapped=False).parameters
+    for name, param in parameters.items():
+        if param.kind == param.VAR_POSITIONAL:
+            varargs = name
+        elif param.kind == param.VAR_KEYWORD:
+            keywords = name
+        elif param.kind == param.KEYWORD_ONLY:
+            kwonlyargs.append(name)
+        else:
+            args.append(name)
+            if param.default is not param.empty:
+                defaults.append(param.default)
+        if param.default is not param.empty:
+            arg_defaults[name] = param.default
+    return ArgSpec(args=args, varargs=varargs, keywords=keywords,
+                   defaults=tuple(defaults) or None, kwonlyargs=kwonlyargs,
+                   arg_defaults=arg_defaults)
@@ -0,0 +1,194 @@
+"""
+Run a click command over many sets of arguments in a single process.
+"""
+import functools
+import json
+import shlex
+import traceback
+
+import click
+
+from .call import print_deferred
+from .parallel import run_invocations, with_job_settings
+from .util import mk_decorator
+
+
+def batch(flag='--batch'):
+    """
+    Add an option which reads argument lines from a file (or stdin, if
+    the file is `-`) and invokes the command once per line, in the same
+    process, instead of running it once with the command-line arguments.
+
+    Each non-blank line that does not start with `#` is either:
+      - a shell-quoted argv, e.g. `--name 'a b' -n 3`, or
+      - a JSON object mapping parameter names to values, e.g.
+        `{"name": "a b", "n": 3}`. Boolean flags map to their on / off
+        flags, and lists become repeated options.
+
+    Every line goes through the same click parsing and decorators as a
+    regular invocation. The exit status of each line is reported on
+    stderr, and the command exits with status 1 if any line failed.
+
+    Like `--help`, `--batch` is eager: the batch runs as soon as it is
+    processed, and the command's other arguments on the command line
+    (except `--jobs`) are ignored.
+
+    If the command also uses `clickutil.jobs`, lines are run in parallel
+    according to `--jobs`, and the first failing line cancels the rest.
+
+    PARAMETERS
+    ----------
+    flag : str
+        The flag used to pass the batch file.
+
+    """
+    return mk_decorator(click.option(
+        flag, type=click.File('r'), default=None, expose_value=False,
+        is_eager=True, callback=_start_batch,
+        help='run once per line of this file ("-" for stdin) of '
+             'shell-quoted arguments or JSON objects'
+    ))
+
+
+def _start_batch(ctx, param, batch_file):
+    # The batch runs from this callback, and exits, before click gets to
+    # the command's other parameters, whose real values come from the
+    # lines of the batch (so the command line need not have them). The
+    # eager `--jobs` option may not have been processed yet, though.
+    if batch_file is None or ctx.resilient_parsing:
+        return
+    ctx.meta[_META_KEY] = batch_file
+    with_job_settings(ctx, lambda settings: _run_batch(ctx, settings))
+
+
+_META_KEY = 'clickutil.batch'
+
+
+def _run_batch(ctx, settings):
+    lines = _numbered_lines(ctx.meta[_META_KEY])
+    if settings.jobs > 1:
+        results = _run_parallel_lines(ctx, lines, settings)
+    else:
+        results = ((lineno, _run_line(ctx, line)) for lineno, line in lines)
+    failures = 0
+    try:
+        for lineno, status in results:
+            click.echo('[batch] line %d: exit status %d' % (lineno, status),
+                       err=True)
+            if status != 0:
+                failures += 1
+                if settings.jobs > 1:
+                    break
+    finally:
+        results.close()
+    ctx.exit(1 if failures else 0)
+
+
+def _numbered_lines(batch_file):
+    for lineno, line in enumerate(batch_file, 1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield lineno, line
+
+
+def _run_parallel_lines(ctx, lines, settings):
+    results = run_invocations(
+        functools.partial(_run_numbered_line, ctx), lines, settings)
+    try:
+        for (lineno, status), outputs in results:
+            if status == 0:
+                status = _exit_status(print_deferred, outputs)
+            yield lineno, status
+    finally:
+        results.close()
+
+
+def _run_numbered_line(ctx, numbered_line):
+    lineno, line = numbered_line
+    return lineno, _run_line(ctx, line)
+
+
+def _run_line(ctx, line):
+    """
+    Invoke the command of `ctx` on a single batch `line`, returning
+    its exit status rather than exiting.
+
+    """
+    return _exit_status(_invoke_line, ctx, line)
+
+
+def _invoke_line(ctx, line):
+    command = ctx.command
+    args = _line_to_args(command, line)
+    with command.make_context(ctx.info_name, args,
+                              parent=ctx.parent) as sub_ctx:
+        command.invoke(sub_ctx)
+
+
+def _exit_status(f, *args):
+    """
+    Call `f(*args)`, returning the exit status that click would exit with
+    if it raised, or 0.
+
+    """
+    try:
+        f(*args)
+        return 0
+    except click.exceptions.Exit as e:
+        return e.exit_code
+    except click.ClickException as e:
+        e.show()
+        return e.exit_code
+    except click.Abort:
+        click.echo('Aborted!', err=True)
+        return 1
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        return e.code if isinstance(e.code, int) else 1
+    except Exception:
+        click.echo(traceback.format_exc(), err=True, nl=False)
+        return 1
+
+
+def _line_to_args(command, line):
+    """
+    Convert a batch line, which is either shell-quoted arguments or a JSON
+    object, to an argv for `command`.
+
+    """
+    if line.startswith('{'):
+        return _json_to_args(command, json.loads(line))
+    return shlex.split(line)
+
+
+def _json_to_args(command, values):
+    """
+    Convert a dict of parameter values to an argv for `command`.
+
+    """
+    if not isinstance(values, dict):
+        raise click.UsageError('batch JSON lines must be objects, got %r'
+                               % (values,))
+    params = dict((param.name, param) for param in command.params)
+    options = []
+    arguments = []
+    for name, value in values.items():
+        if name not in params:
+            raise click.UsageError('unknown parameter %r in batch line'
+                                   % name)
+        param = params[name]
+        if isinstance(param, click.Argument):
+            if isinstance(value, list):
+                arguments.extend(str(v) for v in value)
+            else:
+                arguments.append(str(value))
+        elif getattr(param, 'is_flag', False):
+            if value:
+                options.append(param.opts[0])
+            elif param.secondary_opts:
+                options.append(param.secondary_opts[0])
+        else:
+            for v in (value if isinstance(value, list) else [value]):
+                options.extend([param.opts[0], str(v)])
+    return options + ['--'] + arguments
@@ -0,0 +1,475 @@
+"""
+Memoize commands which are pure functions of their options and input
+files, on disk, so that re-running one with the same arguments skips the
+work, or (with `incremental`) only processes the input files which changed.
+
+A result is keyed on the bound arguments of the target, its code, defaults
+and closure variables, the modification time of the module defining it, and
+the size and modification time (or, optionally, the contents) of every path
+argument that must exist, such as those of type `clickutil.EXISTING_FILE` or
+`clickutil.EXISTING_DIR` (or, outside of a click command, every argument
+naming an existing path).
+Results are pickled into a cache directory, whose total size is capped by
+evicting the least recently used results.
+
+"""
+import collections.abc
+import functools
+import hashlib
+import inspect
+import marshal
+import os
+import pickle
+import sys
+
+import click
+
+from .argspec import update_wrapper
+from .call import call
+from .util import user_cache_dir
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def cached(target, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES,
+           hash_contents=False, path_args=None):
+    """
+    Return a version of `target` which caches its results on disk. It
+    keeps the argspec of `target`, so it can be used anywhere `target`
+    can, for example as `use_output(cached(target))`, in which case the
+    printer replays cached results.
+
+    Results that are iterators (for example, from generator functions)
+    are stored as lists, and returned as iterators over them. Calls which
+    raise, and calls whose arguments or results (or `target`'s defaults
+    and closure variables) can't be pickled, are not cached. Since the
+    values of closure variables are part of the key, a target which
+    updates one (say, by appending to a list) misses the cache each time.
+    Since results are unpickled, the cache directory should only be
+    writable by you.
+
+    PARAMETERS
+    ----------
+    target : function
+        The function to call.
+    cache_dir : {str, None}
+        Where to store results. Defaults to `$XDG_CACHE_HOME/clickutil/calls`
+        (or `~/.cache/clickutil/calls`).
+    max_bytes : int
+        The maximum total size of the cached results. Results larger
+        than this are never cached.
+    hash_contents : boolean
+        If True, key on the contents of path arguments rather than on
+        their sizes and modification times. This survives touching files,
+        but costs a read of every input on every run.
+    path_args : {list of str, None}
+        The names of the arguments of `target` which are paths of inputs.
+        If None, these are detected from the parameters of the current
+        click command which have a `click.Path` type with `exists=True`,
+        or, when there is no click command (say, when calling the result
+        directly), they are the arguments which are strings (or lists or
+        tuples of strings) naming existing paths.
+
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(user_cache_dir(), 'calls')
+    signature = inspect.signature(target)
+
+    def wrapper(*args, **kwargs):
+        key = _cache_key(target, signature, args, kwargs, hash_contents,
+                         path_args)
+        if key is None:
+            return target(*args, **kwargs)
+        path = os.path.join(cache_dir, key + '.pickle')
+        entry = _load(path)
+        if entry is None:
+            result = target(*args, **kwargs)
+            is_iterator = isinstance(result, collections.abc.Iterator)
+            if is_iterator:
+                result = list(result)
+            entry = (is_iterator, result)
+            _store(path, entry, cache_dir, max_bytes)
+        is_iterator, result = entry
+        return iter(result) if is_iterator else result
+
+    update_wrapper(wrapper, target)
+    return wrapper
+
+
+def cached_call(target, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES,
+                hash_contents=False, path_args=None, fast=False):
+    """
+    Like `call`, but caching the results of `target` on disk. See `cached`
+    for the parameters.
+
+    EXAMPLE
+    -------
+
+    >>> @click.command('summarize')
+    >>> @clickutil.option('--data', None, clickutil.EXISTING_FILE,
+                          'the data to summarize')
+    >>> @clickutil.cached_call(summarize, max_bytes=10 * 1024 ** 2)
+    >>> def _summarize(): pass
+
+    """
+    return call(cached(target, cache_dir, max_bytes, hash_contents,
+                       path_args),
+                fast=fast)
+
+
+def incremental(target, path_arg, index_dir=None, hash_contents=False):
+    """
+    Return a version of `target`, a function which processes many files,
+    that only passes it the files which are new or changed since the last
+    run with the same other arguments, and merges its results for those
+    with the stored results for the rest.
+
+    `target` must return one result per file it is passed, either as a
+    mapping from path to result (files missing from the mapping are
+    treated as having no result), or as a sequence in the same order as
+    the paths. The returned function returns the same kind of output for
+    all of the files it is passed, in their order.
+
+    The state (size, modification time and, with `hash_contents`, a
+    content hash) and result of each file are kept in an index, pickled
+    in `index_dir`. Like `cached`, the returned function keeps the
+    argspec of `target`.
+
+    PARAMETERS
+    ----------
+    target : function
+        The function to call.
+    path_arg : str
+        The name of the argument of `target` which is a list of input
+        paths, for example one with type
+        `{'multiple': True, 'type': clickutil.EXISTING_FILE}`.
+    index_dir : {str, None}
+        Where to store indices. Defaults to
+        `$XDG_CACHE_HOME/clickutil/incremental` (or
+        `~/.cache/clickutil/incremental`).
+    hash_contents : boolean
+        If True, also hash the contents of each file whose size or
+        modification time changed, and don't reprocess it if its
+        contents are the same. This costs a read of each such file.
+
+    EXAMPLE
+    -------
+
+    >>> @click.command('index')
+    >>> @clickutil.option('--doc', None,
+                          {'multiple': True,
+                           'type': clickutil.EXISTING_FILE},
+                          'documents to index')
+    >>> @clickutil.use_output(clickutil.incremental(count_words, 'doc'))
+    >>> def _index(counts):
+            click.echo(sum(counts.values()))
+
+    """
+    if index_dir is None:
+        index_dir = os.path.join(user_cache_dir(), 'incremental')
+    signature = inspect.signature(target)
+
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        paths = bound.arguments[path_arg]
+        key = _digest(target, [(name, value)
+                               for name, value in bound.arguments.items()
+                               if name != path_arg])
+        if key is None or not paths:
+            return target(*args, **kwargs)
+        index_path = os.path.join(index_dir, key + '.pickle')
+        index = _load(index_path) or {'kind': None, 'files': {}}
+
+        files = {}
+        changed = []
+        for path in paths:
+            abspath = os.path.abspath(path)
+            if abspath in files:
+                continue
+            previous = index['files'].get(abspath)
+            state, unchanged = _file_state(path, previous, hash_contents)
+            if unchanged:
+                files[abspath] = state + previous[3:]
+            else:
+                files[abspath] = state
+                changed.append(path)
+
+        kind = index['kind']
+        if changed:
+            if isinstance(paths, tuple):
+                bound.arguments[path_arg] = tuple(changed)
+            else:
+                bound.arguments[path_arg] = changed
+            kind, results = _file_results(
+                changed, target(*bound.args, **bound.kwargs))
+            for path, result in zip(changed, results):
+                files[os.path.abspath(path)] += result
+
+        try:
+            _write_atomically(index_path, pickle.dumps(
+                {'kind': kind, 'files': files}, protocol=4))
+        except (IOError, OSError, pickle.PicklingError, TypeError,
+                AttributeError):
+            pass
+
+        if kind == 'sequence':
+            return [files[os.path.abspath(path)][4] for path in paths]
+        output = collections.OrderedDict()
+        for path in paths:
+            _, _, _, has_result, result = files[os.path.abspath(path)]
+            if has_result:
+                output[path] = result
+        return output
+
+    update_wrapper(wrapper, target)
+    return wrapper
+
+
+def _file_state(path, previous, hash_contents):
+    """
+    Return the `(size, mtime, hash)` of the file at `path`, and whether it
+    is unchanged from its `previous` index entry.
+
+    """
+    info = os.stat(path)
+    state = (info.st_size, info.st_mtime_ns, None)
+    if previous is not None and previous[:2] == state[:2]:
+        return previous[:3], True
+    if not hash_contents:
+        return state, False
+    state = state[:2] + (_hash_file(path),)
+    return state, previous is not None and previous[2] == state[2]
+
+
+def _file_results(paths, output):
+    """
+    Split the `output` of a target called with `paths` into a
+    `(has_result, result)` tuple per path, also returning whether the
+    output was a 'mapping' or a 'sequence'.
+
+    """
+    if isinstance(output, collections.abc.Mapping):
+        return 'mapping', [(path in output, output.get(path))
+                           for path in paths]
+    output = list(output)
+    if len(output) != len(paths):
+        raise ValueError('expected %d results, one per file, but got %d'
+                         % (len(paths), len(output)))
+    return 'sequence', [(True, result) for result in output]
+
+
+def _cache_key(target, signature, args, kwargs, hash_contents, path_args):
+    """
+    Return a hex digest identifying a call, or None if the arguments
+    can't be pickled.
+
+    """
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = bound.arguments
+    if path_args is None:
+        path_args = _click_path_args()
+    if path_args is None:
+        path_args = [name for name, value in arguments.items()
+                     if _names_existing_paths(value)]
+    inputs = []
+    for name in sorted(path_args):
+        paths = arguments.get(name)
+        if isinstance(paths, (str, os.PathLike)):
+            paths = [paths]
+        elif not isinstance(paths, (list, tuple)):
+            # for example, a `clickutil.MAPPED_FILE` view
+            continue
+        for path in paths:
+            inputs.append((path, _fingerprint(path, hash_contents)))
+    return _digest(target, (list(arguments.items()), inputs))
+
+
+def _digest(target, data):
+    """
+    Return a hex digest of `target` (see `_function_state`) and `data`,
+    or None if either can't be pickled.
+
+    """
+    try:
+        material = _pickled(_canonical((_function_state(target), data)))
+    except (pickle.PicklingError, TypeError, AttributeError, ValueError):
+        return None
+    return hashlib.sha256(material).hexdigest()
+
+
+def _canonical(value):
+    """
+    Return `value` with the sets in it (inside lists, tuples and dicts)
+    replaced by sorted tuples, so that its pickle doesn't depend on the
+    iteration order of sets, which varies with `PYTHONHASHSEED`.
+
+    """
+    if isinstance(value, (set, frozenset)):
+        items = sorted((_canonical(item) for item in value), key=_pickled)
+        return (_SET_TAG, type(value).__name__, tuple(items))
+    if type(value) in (list, tuple):
+        return type(value)(_canonical(item) for item in value)
+    if type(value) is dict:
+        return dict((_canonical(k), _canonical(v)) for k, v in value.items())
+    return value
+
+
+_SET_TAG = 'clickutil.cache.set'
+
+
+def _pickled(value):
+    return pickle.dumps(value, protocol=4)
+
+
+def _function_state(target):
+    """
+    Return what determines the behavior of the function `target`: its
+    name, code, defaults, the values of its closure variables and the
+    modification time of its module, or for a `functools.partial`, its
+    function and arguments.
+
+    """
+    if isinstance(target, functools.partial):
+        return (_function_state(target.func), target.args, target.keywords)
+    closure = getattr(target, '__closure__', None) or ()
+    return (target.__module__, target.__qualname__, _code(target),
+            getattr(target, '__defaults__', None),
+            getattr(target, '__kwdefaults__', None),
+            [_cell_contents(cell) for cell in closure],
+            _module_mtime(target))
+
+
+def _cell_contents(cell):
+    try:
+        return cell.cell_contents
+    except ValueError:
+        # a variable not assigned yet
+        return None
+
+
+def _click_path_args():
+    """
+    Return the names of the parameters of the current click command which
+    must be existing paths, or None if there is no click command.
+
+    """
+    ctx = click.get_current_context(silent=True)
+    if ctx is None:
+        return None
+    return [param.name for param in ctx.command.params
+            if isinstance(param.type, click.Path) and param.type.exists]
+
+
+def _names_existing_paths(value):
+    if isinstance(value, (list, tuple)):
+        return bool(value) and all(_names_existing_paths(item)
+                                   for item in value)
+    return (isinstance(value, (str, os.PathLike)) and value != '' and
+            os.path.exists(value))
+
+
+def _code(target):
+    code = getattr(target, '__code__', None)
+    return None if code is None else marshal.dumps(code)
+
+
+def _module_mtime(target):
+    path = getattr(sys.modules.get(target.__module__), '__file__', None)
+    try:
+        return os.path.getmtime(path)
+    except (OSError, TypeError):
+        return None
+
+
+def _fingerprint(path, hash_contents):
+    """
+    Summarize the state of the file or directory at `path`, recursively.
+
+    """
+    try:
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                names = sorted(entry.name for entry in entries)
+            return [(name, _fingerprint(os.path.join(path, name),
+                                        hash_contents))
+                    for name in names]
+        if hash_contents:
+            return _hash_file(path)
+        info = os.stat(path)
+        return (info.st_size, info.st_mtime_ns)
+    except OSError:
+        return None
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load(path):
+    try:
+        with open(path, 'rb') as f:
+            entry = pickle.load(f)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError,
+            AttributeError, ImportError):
+        return None
+    try:
+        # the modification time orders entries for eviction
+        os.utime(path)
+    except OSError:
+        pass
+    return entry
+
+
+def _store(path, entry, cache_dir, max_bytes):
+    try:
+        data = pickle.dumps(entry, protocol=4)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return
+    if len(data) > max_bytes:
+        return
+    try:
+        _write_atomically(path, data)
+        _evict(cache_dir, max_bytes)
+    except (IOError, OSError):
+        pass
+
+
+def _write_atomically(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write then rename, so concurrent runs never see a partial file
+    tmp_path = '%s.%d' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _evict(cache_dir, max_bytes):
+    """
+    Remove the least recently used results until the total size of
+    `cache_dir` is at most `max_bytes`.
+
+    """
+    entries = []
+    with os.scandir(cache_dir) as scan:
+        for entry in scan:
+            if entry.name.endswith('.pickle'):
+                info = entry.stat()
+                entries.append((info.st_mtime_ns, info.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
@@ -1,10 +1,26 @@
 """
 Base decorators for use with clickutil.
 """
-import wrapt
+import collections.abc
+import sys
+import threading
+import time
+import weakref
 
+from . import timing
+from .aio import sync_invoker
+from .argspec import update_wrapper
 
-def call(target):
+
+# The printing functions of `use_output` wrappers, by id, so that workers
+# forked by `clickutil.run_parallel` can refer to them in results that the
+# parent process prints (see `deferring_printers`).
+_printers = weakref.WeakValueDictionary()
+
+_deferred = threading.local()
+
+
+def call(target, fast=False, loop_factory=None):
     """
     Tool to wrap a call to `target` as a decorator on a placeholder function.
 
@@ -20,20 +36,51 @@ def call(target):
     Can be used to wrap a call to `target` inside a click command without
     loosing `target` in the current namespace.
 
+    PARAMETERS
+    ----------
+    target : function
+        The function to call.
+    fast : boolean
+        If True, return a plain function with the argspec of `target`
+        attached via `argspec.update_wrapper`, rather than a `wrapt`
+        proxy. This skips wrapt's per-call overhead, at the cost of
+        `wrapt`'s more faithful metadata (e.g. `isinstance` checks and
+        attributes set on `target` later on are not proxied).
+    loop_factory : {function, None}
+        If `target` is a coroutine function, it is run to completion on an
+        event loop created by `loop_factory`, which defaults to the one set
+        with `set_loop_factory`. Async generator functions return an
+        iterator which runs the loop to produce each item.
+
     """
     def decorator(placeholder):
-        @wrapt.decorator
-        def make_wrapper(wrapped, instance, args, kwargs):
-            return wrapped(*args, **kwargs)
-
-        wrapper = make_wrapper(target)
+        invoke = sync_invoker(target, loop_factory)
+        if fast:
+            def wrapper(*args, **kwargs):
+                if timing.current() is None:
+                    return invoke(*args, **kwargs)
+                return timing.timed('call', invoke, args, kwargs)
+            update_wrapper(wrapper, target)
+        else:
+            import wrapt
+
+            @wrapt.decorator
+            def make_wrapper(wrapped, instance, args, kwargs):
+                if invoke is not target:
+                    wrapped = sync_invoker(wrapped, loop_factory)
+                if timing.current() is None:
+                    return wrapped(*args, **kwargs)
+                return timing.timed('call', wrapped, args, kwargs)
+
+            wrapper = make_wrapper(target)
         wrapper.__name__ = placeholder.__name__
         wrapper.__module__ = placeholder.__module__
         return wrapper
     return decorator
 
 
-def use_output(target):
+def use_output(target, fast=False, stream=False, buffer_size=1000,
+               flush_interval=1.0, loop_factory=None):
     """
     Tool to wrap a call to `target` as a decorator on a function that
     does something with its output.
@@ -51,17 +98,153 @@ def use_output(target):
         for thing in output:
             print(thing)
 
+    PARAMETERS
+    ----------
+    target : function
+        The function to call.
+    fast : boolean
+        See `call`.
+    stream : boolean
+        If True and `target` returns an iterator (for example if it is a
+        generator function), feed its items to `printer` as they are
+        produced rather than waiting for the target to finish. The
+        printer is called repeatedly, each time with a list of at most
+        `buffer_size` items, and stdout is flushed after each call. Since
+        the output is consumed by the printer, the wrapper returns None
+        in this case. Outputs that are not iterators are passed to the
+        printer as usual.
+    buffer_size : int
+        Maximum number of items to hold before calling the printer, when
+        streaming.
+    flush_interval : float
+        Maximum number of seconds to hold items before calling the
+        printer, when streaming. This is checked as each item arrives.
+    loop_factory : {function, None}
+        See `call`. Outputs of async generator functions are iterators,
+        so with `stream` they are printed as their items arrive.
+
     """
     def decorator(printer):
-        @wrapt.decorator
-        def make_wrapper(wrapped, instance, args, kwargs):
-            output = wrapped(*args, **kwargs)
-            printer(output)
+        invoke = sync_invoker(target, loop_factory)
+
+        def print_output(output):
+            outputs = getattr(_deferred, 'outputs', None)
+            if outputs is not None:
+                return _defer(outputs, print_output, output)
+            timed = timing.current() is not None
+            if stream and isinstance(output, collections.abc.Iterator):
+                chunks = _buffered(output, buffer_size, flush_interval)
+                if timed:
+                    chunks = _timed_chunks(chunks)
+                for chunk in chunks:
+                    if timed:
+                        timing.timed('print', printer, (chunk,))
+                    else:
+                        printer(chunk)
+                    sys.stdout.flush()
+                return None
+            if timed:
+                timing.timed('print', printer, (output,))
+            else:
+                printer(output)
             return output
 
-        wrapper = make_wrapper(target)
+        _printers[id(print_output)] = print_output
+
+        if fast:
+            def wrapper(*args, **kwargs):
+                if timing.current() is None:
+                    return print_output(invoke(*args, **kwargs))
+                return print_output(
+                    timing.timed('call', invoke, args, kwargs))
+            update_wrapper(wrapper, target)
+        else:
+            import wrapt
+
+            @wrapt.decorator
+            def make_wrapper(wrapped, instance, args, kwargs):
+                if invoke is not target:
+                    wrapped = sync_invoker(wrapped, loop_factory)
+                if timing.current() is None:
+                    return print_output(wrapped(*args, **kwargs))
+                return print_output(
+                    timing.timed('call', wrapped, args, kwargs))
+
+            wrapper = make_wrapper(target)
         wrapper.__name__ = printer.__name__
         wrapper.__module__ = printer.__module__
         return wrapper
 
     return decorator
+
+
+def deferring_printers(func):
+    """
+    Return a version of `func` which doesn't call the printers of any
+    `use_output` wrappers it calls, but returns a `(result, outputs)`
+    tuple, where `outputs` can be printed later (and in another process
+    forked from this one) with `print_deferred`.
+
+    """
+    def wrapped(*args, **kwargs):
+        outer = getattr(_deferred, 'outputs', None)
+        _deferred.outputs = outputs = []
+        try:
+            return func(*args, **kwargs), outputs
+        finally:
+            _deferred.outputs = outer
+    return wrapped
+
+
+def _defer(outputs, print_output, output):
+    is_iterator = isinstance(output, collections.abc.Iterator)
+    if is_iterator:
+        output = list(output)
+    outputs.append((id(print_output), is_iterator, output))
+    # printing consumes an iterator, so there's nothing left to return
+    return None if is_iterator else output
+
+
+def print_deferred(outputs):
+    """
+    Call the `use_output` printers whose calls `deferring_printers`
+    deferred.
+
+    """
+    for key, is_iterator, output in outputs:
+        print_output = _printers[key]
+        print_output(iter(output) if is_iterator else output)
+
+
+def _buffered(iterator, buffer_size, flush_interval):
+    """
+    Group the items of `iterator` into lists of at most `buffer_size`
+    items, yielding early whenever `flush_interval` seconds have passed
+    since the last yield.
+
+    """
+    buffer = []
+    last_flush = time.monotonic()
+    for item in iterator:
+        buffer.append(item)
+        if (len(buffer) >= buffer_size or
+                time.monotonic() - last_flush >= flush_interval):
+            yield buffer
+            buffer = []
+            last_flush = time.monotonic()
+    if buffer:
+        yield buffer
+
+
+def _timed_chunks(chunks):
+    """
+    Count the time spent producing each chunk of a streamed output as
+    part of the 'call' phase, since that's when the target's body runs.
+
+    """
+    while True:
+        try:
+            chunk = timing.timed('call', next, (chunks,))
+        except StopIteration:
+            return
+        yield chunk
@@ -1,12 +1,171 @@
+import importlib
+import time
+
 import click
 
+from . import timing
+from .manifest import load_manifest, manifest_command
+
 
 def command(parent):
     if parent is None:
         parent = click
 
     def decorator(f):
-        command_name = f.__name__.strip('_').replace('_', '-')
-        return parent.command(command_name)(f)
+        return parent.command(_command_name(f.__name__))(f)
+
+    return decorator
+
+
+def lazy_group(parent, commands, **attrs):
+    """
+    Like `command`, but creates a click group whose subcommands are
+    declared by dotted path and only imported when they are invoked.
+
+    PARAMETERS
+    ----------
+    parent : {click.Group, None}
+        The group to attach the new group to. If None, the new group
+        is a top-level group.
+    commands : dict
+        Map from the dotted path of each subcommand (for example
+        'mypkg.commands._do_something', or equivalently
+        'mypkg.commands:_do_something') to the short help shown for it
+        in `--help` listings. The command name is derived from the
+        attribute name the same way `command` derives it, so the above
+        would be available as `do-something`.
+    attrs : kwargs
+        Extra keyword arguments passed to the click group. In particular,
+        `manifest` may be the path of a manifest written by
+        `clickutil.write_manifest`, which is used to answer `--help` and
+        completion for subcommands without importing them.
+
+    EXAMPLE
+    -------
+
+    >>> @lazy_group(None, {
+            'mypkg.build._build': 'build the project',
+            'mypkg.deploy._deploy_all': 'deploy every service',
+        })
+        def _cli(): pass
+
+    """
+    if parent is None:
+        parent = click
+    attrs.setdefault('cls', LazyGroup)
+
+    def decorator(f):
+        return parent.group(_command_name(f.__name__),
+                            lazy_commands=commands, **attrs)(f)
 
     return decorator
+
+
+class LazyGroup(click.Group):
+    """
+    A click group which imports the module holding a subcommand only
+    when that subcommand is selected. Listing commands in `--help`
+    uses the declared short help, so it never imports anything.
+
+    PARAMETERS
+    ----------
+    lazy_commands : dict
+        See the `commands` parameter of `lazy_group`.
+    manifest : {str, None}
+        Path of a manifest written by `clickutil.write_manifest`. See
+        `clickutil.manifest`.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        lazy_commands = kwargs.pop('lazy_commands', None) or {}
+        self.manifest_path = kwargs.pop('manifest', None)
+        self._manifest = None
+        super(LazyGroup, self).__init__(*args, **kwargs)
+        self.lazy_commands = {}
+        for path, short_help in lazy_commands.items():
+            module_name, attr = _split_path(path)
+            self.lazy_commands[_command_name(attr)] = (
+                module_name, attr, short_help
+            )
+
+    def list_commands(self, ctx):
+        return sorted(set(self.commands) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            stand_in = self._manifest_command(cmd_name)
+            if stand_in is not None:
+                return stand_in
+        return self.load_command(cmd_name)
+
+    def load_command(self, cmd_name):
+        """
+        Return the real command named `cmd_name`, importing it if needed.
+
+        """
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            self.commands[cmd_name] = self._load(cmd_name)
+        return self.commands.get(cmd_name)
+
+    def format_commands(self, ctx, formatter):
+        rows = []
+        for cmd_name in self.list_commands(ctx):
+            if cmd_name in self.commands:
+                cmd = self.commands[cmd_name]
+                if getattr(cmd, 'hidden', False):
+                    continue
+                rows.append((cmd_name, cmd.get_short_help_str()))
+            else:
+                rows.append((cmd_name, self.lazy_commands[cmd_name][2]))
+        if rows:
+            with formatter.section('Commands'):
+                formatter.write_dl(rows)
+
+    def _manifest_command(self, cmd_name):
+        if self.manifest_path is None:
+            return None
+        if self._manifest is None:
+            self._manifest = load_manifest(self.manifest_path) or {
+                'commands': {}
+            }
+        return manifest_command(
+            self._manifest, cmd_name,
+            lambda: self.load_command(cmd_name)
+        )
+
+    def _load(self, cmd_name):
+        module_name, attr, _ = self.lazy_commands[cmd_name]
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        timing.record_import(module_name, time.perf_counter() - start)
+        cmd = getattr(module, attr)
+        if not isinstance(cmd, click.Command):
+            raise ValueError('Lazy command %r resolved to %r, which is not '
+                             'a click command' % (cmd_name, cmd))
+        return cmd
+
+
+def _command_name(name):
+    """
+    Convert a python function name into a command name, for example
+    `_do_something` becomes `do-something`.
+
+    """
+    return name.strip('_').replace('_', '-')
+
+
+def _split_path(path):
+    """
+    Split a 'package.module.attr' or 'package.module:attr' path into
+    its module and attribute parts.
+
+    """
+    if ':' in path:
+        module_name, attr = path.split(':', 1)
+    else:
+        module_name, _, attr = path.rpartition('.')
+    if not module_name or not attr:
+        raise ValueError('Lazy command path %r must have the form '
+                         '"module.attr" or "module:attr"' % path)
+    return module_name, attr
@@ -0,0 +1,206 @@
+"""
+Fast shell completion for clickutil options.
+
+Completing a path option normally hands control back to the shell, and
+completing an option with dynamic candidates (hostnames from an API, job
+names from a database, ...) recomputes them on every TAB. This module
+provides a `click.Path` type which completes with `os.scandir`, and a way to
+cache dynamic candidates on disk between TABs.
+
+"""
+import hashlib
+import json
+import os
+import time
+
+import click
+
+from .util import user_cache_dir
+
+
+class ScandirPath(click.Path):
+    """
+    A `click.Path` which completes paths itself using `os.scandir`,
+    offering only directories (to descend into) and, if `file_okay`,
+    files. Hidden entries are offered only if the prefix being completed
+    starts with a dot.
+
+    """
+
+    def shell_complete(self, ctx, param, incomplete):
+        from click.shell_completion import CompletionItem
+        return [CompletionItem(value)
+                for value in scandir_candidates(incomplete, self.file_okay)]
+
+
+class CompletingOption(click.Option):
+    """
+    A `click.Option` which records its `shell_complete` callback as
+    `complete`, so that tools such as `clickutil.manifest` can tell that
+    it completes differently from its type. `clickutil.option` uses it for
+    types with a 'complete' entry.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CompletingOption, self).__init__(*args, **kwargs)
+        self.complete = kwargs.get('shell_complete')
+
+
+def scandir_candidates(incomplete, file_okay=True):
+    """
+    Return the sorted paths starting with `incomplete`, with directories
+    ending in a path separator.
+
+    """
+    dirname, prefix = os.path.split(incomplete)
+    show_hidden = prefix.startswith('.')
+    candidates = []
+    try:
+        with os.scandir(os.path.expanduser(dirname) or '.') as entries:
+            for entry in entries:
+                name = entry.name
+                if not name.startswith(prefix):
+                    continue
+                if name.startswith('.') and not show_hidden:
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if is_dir:
+                    candidates.append(os.path.join(dirname, name) + os.sep)
+                elif file_okay:
+                    candidates.append(os.path.join(dirname, name))
+    except OSError:
+        return []
+    return sorted(candidates)
+
+
+def cached_completion(get_candidates, ttl=300, watch=(), cache_dir=None):
+    """
+    Create a click `shell_complete` callback which caches the candidates
+    returned by `get_candidates` on disk, so that they are computed once
+    rather than on every TAB.
+
+    The cache is keyed on the command path and the parameter name, and
+    holds every candidate; they are filtered by the incomplete value on
+    each lookup.
+
+    PARAMETERS
+    ----------
+    get_candidates : function
+        Called as `get_candidates(ctx, param)`, it returns an iterable of
+        candidates, each either a string or a `(value, help)` tuple.
+    ttl : float
+        How many seconds cached candidates stay valid.
+    watch : list of str
+        Paths (for example, a config file the candidates are read from)
+        whose modification invalidates the cache.
+    cache_dir : {str, None}
+        Where to store the cache. Defaults to `$XDG_CACHE_HOME/clickutil`
+        (or `~/.cache/clickutil`).
+
+    EXAMPLE
+    -------
+
+    >>> @clickutil.option('--host', None,
+                          {'type': str,
+                           'complete': cached_completion(list_hosts)},
+                          'the host to use')
+
+    """
+    def shell_complete(ctx, param, incomplete):
+        items = _complete_from_cache(ctx, param, incomplete, ttl, watch,
+                                     cache_dir)
+        if items is not None:
+            return items
+        candidates = [_normalize(c) for c in get_candidates(ctx, param)]
+        _write_cache(_cache_path(cache_dir, _cache_key(ctx, param)),
+                     candidates, watch)
+        return _completion_items(candidates, incomplete)
+
+    # for `clickutil.manifest`, which reads the cache without the command
+    shell_complete.cache_settings = {'ttl': ttl, 'watch': list(watch),
+                                     'cache_dir': cache_dir}
+    return shell_complete
+
+
+def _complete_from_cache(ctx, param, incomplete, ttl, watch, cache_dir):
+    """
+    Return the completions of `param` cached by `cached_completion`, or
+    None if there are none.
+
+    """
+    path = _cache_path(cache_dir, _cache_key(ctx, param))
+    candidates = _read_cache(path, ttl, watch)
+    if candidates is None:
+        return None
+    return _completion_items(candidates, incomplete)
+
+
+def _completion_items(candidates, incomplete):
+    from click.shell_completion import CompletionItem
+    return [CompletionItem(value, help=help)
+            for value, help in candidates
+            if value.startswith(incomplete)]
+
+
+def _cache_key(ctx, param):
+    return '%s %s' % (ctx.command_path, param.name)
+
+
+def _normalize(candidate):
+    if isinstance(candidate, (tuple, list)):
+        return [str(candidate[0]), candidate[1]]
+    return [str(candidate), None]
+
+
+def _cache_path(cache_dir, key):
+    if cache_dir is None:
+        cache_dir = user_cache_dir()
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, 'completion-%s.json' % digest)
+
+
+def _mtimes(paths):
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.path.getmtime(path)
+        except OSError:
+            mtimes[path] = None
+    return mtimes
+
+
+def _read_cache(path, ttl, watch):
+    """
+    Return the candidates cached at `path`, or None if there are none, they
+    are out of date, or the cache can't be read (a partial file, or one
+    from another version of clickutil).
+
+    """
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+        if time.time() - cache['created'] > ttl:
+            return None
+        if cache['mtimes'] != _mtimes(watch):
+            return None
+        return [(value, help) for value, help in cache['candidates']]
+    except Exception:
+        return None
+
+
+def _write_cache(path, candidates, watch):
+    cache = {'created': time.time(), 'mtimes': _mtimes(watch),
+             'candidates': candidates}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, so concurrent TABs never see a partial file
+        tmp_path = '%s.%d' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, path)
+    except (IOError, OSError):
+        pass
@@ -1,6 +1,15 @@
+import json
+import linecache
+import os
+import sys
+import time
+import traceback
+
+import click
+
+from . import timing
 from .args import boolean_flag
-from .argspec import wraps
-import tdx
+from .util import mk_decorator, wraps_command
 
 
 def debug(default=False, delay=3, use_debugger=None):
@@ -27,13 +36,16 @@ def debug(default=False, delay=3, use_debugger=None):
     """
     def decorator(f):
 
-        @wraps(f)
         @boolean_flag(
             '--debug', default=default,
             help='drop into pudb / pdb post-mortem on uncaught errors?'
         )
+        @wraps_command(f)
         def wrapped(debug, *args, **kwargs):
             if debug:
+                # tdx pulls in its debugger machinery, so only import it
+                # when debugging is actually on
+                import tdx
                 return tdx.decorators.debug(
                     delay=delay,
                     use_debugger=use_debugger
@@ -44,3 +56,137 @@ def debug(default=False, delay=3, use_debugger=None):
         return wrapped
 
     return decorator
+
+
+def crash_dump(flag='--crash-dump', envvar='CLICKUTIL_CRASH_DUMP',
+               max_repr=200, max_locals=50):
+    """
+    Add an option which, on an uncaught exception, writes a crash report
+    to the given path and exits with status 1 straight away, rather than
+    blocking on a debugger. This is meant for unattended runs, where
+    `debug` would hang. The option can also be set with an environment
+    variable.
+
+    The report is a JSON object with the `argv`, `cwd`, `pid` and `time`
+    of the run, the `exception` type and message, the formatted
+    `traceback`, each `frame` of the traceback with its locals (repr'd
+    and truncated), and the phase `timings` if the command was timed.
+    Note that locals may include sensitive values.
+
+    Rather than wrapping the command, the option installs a
+    `sys.excepthook`, so this costs nothing unless the command fails.
+
+    PARAMETERS
+    ----------
+    flag : str
+        The flag used to pass the crash report path. If the path is a
+        directory, a report named after the time and pid is written in it.
+    envvar : {str, None}
+        Environment variable which sets the path when the flag is not
+        given.
+    max_repr : int
+        The maximum length of the repr of each local.
+    max_locals : int
+        The maximum number of locals recorded per frame.
+
+    """
+    def install(ctx, param, path):
+        if path is not None and not ctx.resilient_parsing:
+            install_crash_dump(path, max_repr, max_locals)
+
+    return mk_decorator(click.option(
+        flag, type=str, default=None, envvar=envvar, is_eager=True,
+        expose_value=False, callback=install, metavar='PATH',
+        help='on uncaught errors, write a crash report to PATH and exit'
+    ))
+
+
+def install_crash_dump(path, max_repr=200, max_locals=50):
+    """
+    Install a `sys.excepthook` which writes a crash report to `path`,
+    prints the traceback, and exits with status 1. See `crash_dump`.
+
+    The hook is installed once; calling this again (say, when a command
+    is invoked several times in one process) only changes where and how
+    the report is written.
+
+    """
+    hook = sys.excepthook
+    if not isinstance(hook, _CrashDumpHook):
+        hook = sys.excepthook = _CrashDumpHook(hook)
+    hook.path = path
+    hook.max_repr = max_repr
+    hook.max_locals = max_locals
+
+
+class _CrashDumpHook(object):
+
+    def __init__(self, previous_hook):
+        self.previous_hook = previous_hook
+
+    def __call__(self, exc_type, exc, tb):
+        try:
+            self.previous_hook(exc_type, exc, tb)
+            try:
+                report_path = _write_crash_report(self.path, _crash_report(
+                    exc_type, exc, tb, self.max_repr, self.max_locals))
+            except Exception:
+                sys.stderr.write('failed to write a crash report:\n')
+                traceback.print_exc()
+            else:
+                sys.stderr.write('crash report written to %s\n'
+                                 % report_path)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # don't wait on non-daemon threads or atexit handlers
+            os._exit(1)
+
+
+def _crash_report(exc_type, exc, tb, max_repr, max_locals):
+    timings = timing.last()
+    return {
+        'time': time.time(),
+        'pid': os.getpid(),
+        'argv': sys.argv,
+        'cwd': os.getcwd(),
+        'exception': {'type': exc_type.__name__,
+                      'message': _safe_repr(str, exc, max_repr)},
+        'traceback': ''.join(traceback.format_exception(exc_type, exc, tb)),
+        'frames': [_frame_report(frame, lineno, max_repr, max_locals)
+                   for frame, lineno in traceback.walk_tb(tb)],
+        'timings': None if timings is None else timings.phases,
+    }
+
+
+def _frame_report(frame, lineno, max_repr, max_locals):
+    code = frame.f_code
+    local_items = list(frame.f_locals.items())
+    return {
+        'file': code.co_filename,
+        'line': lineno,
+        'function': code.co_name,
+        'code': linecache.getline(code.co_filename, lineno).strip(),
+        'locals': dict((name, _safe_repr(repr, value, max_repr))
+                       for name, value in local_items[:max_locals]),
+        'omitted_locals': max(0, len(local_items) - max_locals),
+    }
+
+
+def _safe_repr(to_str, value, max_length):
+    try:
+        text = to_str(value)
+    except Exception as e:
+        return '<%s failed: %s>' % (to_str.__name__, type(e).__name__)
+    if len(text) > max_length:
+        text = text[:max_length - 3] + '...'
+    return text
+
+
+def _write_crash_report(path, report):
+    if os.path.isdir(path):
+        path = os.path.join(path, 'crash-%s-%d.json' % (
+            time.strftime('%Y%m%d-%H%M%S'), report['pid']))
+    with open(path, 'w') as stream:
+        json.dump(report, stream, indent=2)
+    return path
@@ -0,0 +1,426 @@
+"""
+Parameter types which open input files for the target, rather than
+handing it a path to open itself, and tools for processing large files.
+
+"""
+import functools
+import io
+import mmap
+import os
+import stat
+import sys
+
+import click
+
+from .completion import ScandirPath
+
+
+class MappedFile(ScandirPath):
+    """
+    A parameter type for an existing file, or `-` for stdin, which hands
+    the target a read-only `memoryview` of the file's contents. Regular
+    files are memory-mapped, so slicing the view copies nothing and only
+    the pages actually touched are read. Pipes, stdin and other files
+    which can't be mapped are read into memory instead.
+
+    The underlying object (an `mmap.mmap` for mapped files, otherwise
+    `bytes`) is the view's `obj`, for methods such as `find`. The mapping
+    is closed when the click context closes, after the command has run,
+    so the target must not keep the view (or slices of it) beyond that.
+
+    """
+    name = 'mapped_file'
+
+    def __init__(self):
+        super(MappedFile, self).__init__(exists=True, dir_okay=False,
+                                         file_okay=True, allow_dash=True)
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, memoryview):
+            return value
+        path = super(MappedFile, self).convert(value, param, ctx)
+        try:
+            view = map_file(path)
+        except (IOError, OSError) as e:
+            self.fail('could not read %s: %s' % (path, e), param, ctx)
+        if ctx is not None:
+            ctx.call_on_close(lambda: close_view(view))
+        return view
+
+
+MAPPED_FILE = MappedFile()
+
+
+def map_file(path):
+    """
+    Return a read-only `memoryview` of the contents of the file at `path`
+    (`-` for stdin), memory-mapping it if it is a regular file. See
+    `MappedFile`.
+
+    """
+    if path == '-':
+        stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+        return memoryview(stdin.read())
+    with open(path, 'rb') as f:
+        info = os.fstat(f.fileno())
+        if not stat.S_ISREG(info.st_mode) or info.st_size == 0:
+            # pipes can't be mapped, and neither can empty files
+            return memoryview(f.read())
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def close_view(view):
+    """
+    Release a view returned by `map_file`, and close its mapping. If the
+    target still holds slices of the view, or buffers exported from it
+    (such as a `pickle.PickleBuffer` or a numpy array), the view or the
+    mapping is left for the garbage collector to close instead.
+
+    """
+    mapping = view.obj
+    try:
+        view.release()
+    except BufferError:
+        return
+    if isinstance(mapping, mmap.mmap):
+        try:
+            mapping.close()
+        except BufferError:
+            pass
+
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+DEFAULT_RANGE_BYTES = 64 * 1024 * 1024
+
+# magic bytes of compressed files, and the module which can read them
+_COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'lzma'),
+]
+
+
+class InputStream(ScandirPath):
+    """
+    A parameter type for an existing file, or `-` for stdin, which hands
+    the target an open stream of its contents, transparently decompressing
+    gzip, bz2 and xz files (detected by their first bytes, not their
+    names). Reads use a large buffer, for throughput on big inputs.
+
+    The stream is closed when the click context closes, after the
+    command has run.
+
+    PARAMETERS
+    ----------
+    lines : boolean
+        If True, the target gets a file object, which iterates over lines.
+        Otherwise it gets an iterator over chunks of `buffer_size` bytes.
+    encoding : {str, None}
+        The encoding to decode lines with. If None, lines are bytes.
+        Ignored if `lines` is False.
+    buffer_size : int
+        The number of bytes read from the file (and decompressed) at once.
+
+    """
+    name = 'input_stream'
+
+    def __init__(self, lines=True, encoding='utf-8',
+                 buffer_size=DEFAULT_BUFFER_SIZE):
+        super(InputStream, self).__init__(exists=True, dir_okay=False,
+                                          file_okay=True, allow_dash=True)
+        self.lines = lines
+        self.encoding = encoding
+        self.buffer_size = buffer_size
+
+    def convert(self, value, param, ctx):
+        if not isinstance(value, (str, bytes, os.PathLike)):
+            return value
+        path = super(InputStream, self).convert(value, param, ctx)
+        encoding = self.encoding if self.lines else None
+        try:
+            stream = open_input(path, encoding, self.buffer_size)
+        except (IOError, OSError) as e:
+            self.fail('could not read %s: %s' % (path, e), param, ctx)
+        if ctx is not None:
+            ctx.call_on_close(stream.close)
+        if self.lines:
+            return stream
+        return iter(functools.partial(stream.read, self.buffer_size), b'')
+
+
+INPUT_STREAM = InputStream()
+
+
+def open_input(path, encoding=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    Open the file at `path` (`-` for stdin) for reading, decompressing it
+    if it is gzip, bz2 or xz compressed. See `InputStream`.
+
+    RETURNS
+    -------
+    stream : file object
+        A binary stream if `encoding` is None, otherwise a text stream.
+        Closing it never closes stdin.
+
+    """
+    if path == '-':
+        source = _open_stdin(buffer_size)
+    else:
+        source = open(path, 'rb', buffering=buffer_size)
+    stream = _decompressed(source, buffer_size)
+    if encoding is None:
+        return stream
+    # `stream` is a BufferedReader with a `buffer_size` buffer, so the
+    # small reads TextIOWrapper makes from it are served from memory
+    return io.TextIOWrapper(stream, encoding=encoding)
+
+
+def _open_stdin(buffer_size):
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    try:
+        fd = stdin.fileno()
+    except (AttributeError, ValueError, OSError):
+        # not a real file, e.g. under click's test runner
+        return io.BufferedReader(_Unclosable(stdin), buffer_size)
+    return open(fd, 'rb', buffering=buffer_size, closefd=False)
+
+
+def _decompressed(source, buffer_size):
+    magic, source = _read_magic(
+        source, max(len(m) for m, _ in _COMPRESSION_MAGIC), buffer_size)
+    for prefix, module_name in _COMPRESSION_MAGIC:
+        # bz2's magic is followed by a block size digit
+        if magic.startswith(prefix) and (module_name != 'bz2' or
+                                         magic[3:4].isdigit()):
+            break
+    else:
+        return source
+    if module_name == 'gzip':
+        import gzip
+        decompressor = gzip.GzipFile(fileobj=source, mode='rb')
+    elif module_name == 'bz2':
+        import bz2
+        decompressor = bz2.BZ2File(source)
+    else:
+        import lzma
+        decompressor = lzma.LZMAFile(source)
+    return _DecompressedReader(decompressor, source, buffer_size)
+
+
+def _read_magic(source, size, buffer_size):
+    """
+    Return the first `size` bytes of the buffered reader `source` (fewer
+    only at the end of the file), and a buffered reader of all of its
+    contents, which is `source` itself unless peeking returned too few
+    bytes, as it can for a pipe.
+
+    """
+    magic = source.peek(size)
+    if len(magic) >= size:
+        return magic[:size], source
+    magic = source.read(size)
+    return magic, io.BufferedReader(_Prefixed(magic, source), buffer_size)
+
+
+class _Prefixed(io.RawIOBase):
+    """
+    A raw reader of `prefix` followed by the rest of `stream`, which
+    closes `stream` when closed.
+
+    """
+
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            data = self._prefix[:len(buffer)]
+            self._prefix = self._prefix[len(data):]
+        else:
+            data = self._stream.read1(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            super(_Prefixed, self).close()
+
+
+class _DecompressedReader(io.BufferedReader):
+    """
+    A buffered reader of a decompressor, which also closes the compressed
+    `source` when closed (the decompressors leave it open).
+
+    """
+
+    def __init__(self, decompressor, source, buffer_size):
+        super(_DecompressedReader, self).__init__(decompressor, buffer_size)
+        self._source = source
+
+    def close(self):
+        try:
+            super(_DecompressedReader, self).close()
+        finally:
+            self._source.close()
+
+
+class _Unclosable(io.RawIOBase):
+    """
+    A raw reader of `stream` whose closing leaves `stream` open.
+
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def map_lines(func, path, jobs=None, encoding='utf-8',
+              range_bytes=DEFAULT_RANGE_BYTES, executor=None):
+    """
+    Call `func(line)` for each line of the file at `path`, in a pool of
+    worker processes (or threads), yielding the results in the order of
+    the lines.
+
+    The file is split into byte ranges aligned to line boundaries (see
+    `line_ranges`), and each worker memory-maps the file and processes a
+    range at a time, so the file is never read by the parent process and
+    only the results are sent between processes. A few ranges per worker
+    are in flight at once, which bounds memory use.
+
+    As with `clickutil.run_parallel`, workers are forked, so `func` need
+    not be picklable, but its results must be.
+
+    PARAMETERS
+    ----------
+    func : function
+        Called with each line, including its line ending.
+    path : str
+        A regular file, for example from a `clickutil.EXISTING_FILE`
+        option. Compressed files and pipes can't be split.
+    jobs : {int, None}
+        The number of workers. Defaults to the `--jobs` option, if the
+        current command uses `clickutil.jobs`, otherwise to the number of
+        CPUs. With 1, lines are processed in this process.
+    encoding : {str, None}
+        The encoding to decode lines with. If None, lines are bytes.
+    range_bytes : int
+        The approximate size of the byte range each worker processes at a
+        time. The file is split into at least 4 ranges per worker.
+    executor : {str, None}
+        Either 'process' or 'thread'. Defaults to the executor of the
+        `--jobs` option, if the current command uses `clickutil.jobs`,
+        otherwise to 'process'.
+
+    EXAMPLE
+    -------
+
+    >>> def slow_requests(path):
+            for line in clickutil.map_lines(parse_latency, path):
+                if line > 1.0:
+                    yield line
+
+    """
+    from .parallel import get_job_settings, run_parallel
+    ctx = click.get_current_context(silent=True)
+    settings = None if ctx is None else get_job_settings(ctx, None)
+    if jobs is None:
+        jobs = (os.cpu_count() or 1) if settings is None else settings.jobs
+    if executor is None:
+        executor = 'process' if settings is None else settings.executor
+    size = os.path.getsize(path)
+    count = max(4 * jobs, -(-size // range_bytes))
+    process = functools.partial(_map_range, func, path, encoding)
+    ranges = line_ranges(path, count)
+    if jobs == 1:
+        chunks = map(process, ranges)
+    else:
+        chunks = run_parallel(process, ranges, jobs, executor)
+    try:
+        for chunk in chunks:
+            for result in chunk:
+                yield result
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def line_ranges(path, count):
+    """
+    Split the file at `path` into at most `count` byte ranges of about
+    equal size, each starting at the beginning of a line and ending just
+    after a newline (or at the end of the file).
+
+    RETURNS
+    -------
+    ranges : list of (int, int) tuples
+        The start (inclusive) and end (exclusive) offset of each range.
+
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    ranges = []
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            start = 0
+            for i in range(1, count + 1):
+                if start >= size:
+                    break
+                end = size * i // count
+                if end <= start:
+                    continue
+                if end < size:
+                    newline = mapping.find(b'\n', end - 1)
+                    end = size if newline == -1 else newline + 1
+                ranges.append((start, end))
+                start = end
+    return ranges
+
+
+def _map_range(func, path, encoding, byte_range):
+    start, end = byte_range
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            # reads the range a buffer at a time, rather than copying it all
+            with memoryview(mapping) as whole, whole[start:end] as view:
+                lines = io.BufferedReader(_ViewReader(view))
+                if encoding is not None:
+                    # decodes lines just as iterating over an open() text
+                    # file does
+                    lines = io.TextIOWrapper(lines, encoding=encoding)
+                return list(map(func, lines))
+
+
+class _ViewReader(io.RawIOBase):
+    """
+    A raw reader of the bytes of the memoryview `view`.
+
+    """
+
+    def __init__(self, view):
+        self._view = view
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), len(self._view) - self._position)
+        buffer[:size] = self._view[self._position:self._position + size]
+        self._position += size
+        return size
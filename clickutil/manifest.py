@@ -0,0 +1,342 @@
+"""
+Cache the option schema of lazily loaded commands in a manifest file, so
+that `--help` and shell completion don't need to import them.
+
+A manifest is built (importing every subcommand once) from a `LazyGroup`
+with `write_manifest`, or `python -m clickutil.manifest GROUP_PATH PATH`.
+A `LazyGroup` created with `manifest=PATH` then answers `--help` and
+completion for its subcommands from stand-in commands rebuilt from the
+manifest, and only imports a subcommand when it actually runs. Each
+subcommand's entry records the modification times of the source files it
+depends on, and is ignored once any of them changes.
+
+Parameters whose completion can't be rebuilt from the manifest, such as
+those with a custom type, or a `shell_complete` callback declared with the
+'complete' entry of a clickutil type, are marked in it, and the stand-in
+loads the real command to complete them. (Callbacks passed to click
+directly are not detected.) Parameters using
+`clickutil.cached_completion` are completed from its cache, and only load
+the real command when the cache is out of date.
+
+Subcommands which are themselves groups are not included in manifests.
+
+"""
+import importlib
+import inspect
+import json
+import os
+import sys
+
+import click
+
+from .completion import CompletingOption, ScandirPath, _complete_from_cache
+
+
+MANIFEST_VERSION = 2
+
+# click >= 8.3 marks parameters without a default with a sentinel
+_UNSET = getattr(click.core, 'UNSET', None)
+
+
+def build_manifest(group):
+    """
+    Return a JSON-compatible manifest of the subcommands of a `LazyGroup`,
+    importing each of them.
+
+    """
+    commands = {}
+    for cmd_name in sorted(group.lazy_commands):
+        cmd = group.load_command(cmd_name)
+        if isinstance(cmd, click.Group):
+            continue
+        commands[cmd_name] = {
+            'sources': _source_mtimes(group.lazy_commands[cmd_name][0], cmd),
+            'command': _serialize_command(cmd),
+        }
+    return {'version': MANIFEST_VERSION, 'commands': commands}
+
+
+def write_manifest(group, path):
+    """
+    Write the manifest of a `LazyGroup` to `path`, importing every
+    subcommand.
+
+    """
+    manifest = build_manifest(group)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def load_manifest(path):
+    """
+    Load a manifest written by `write_manifest`, returning None if it is
+    missing, unreadable, or from a different version of clickutil.
+
+    """
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def manifest_command(manifest, cmd_name, loader):
+    """
+    Return a stand-in for subcommand `cmd_name` built from `manifest`, or
+    None if the manifest has no up-to-date entry for it. The stand-in
+    parses `--help` and completion requests itself; any other invocation
+    calls `loader()` to get the real command and runs that instead.
+
+    """
+    entry = manifest['commands'].get(cmd_name)
+    if entry is None or not _sources_unchanged(entry['sources']):
+        return None
+    info = entry['command']
+    return ManifestCommand(
+        loader,
+        name=info['name'],
+        params=[_deserialize_param(p, loader) for p in info['params']],
+        help=info['help'],
+        short_help=info['short_help'],
+        epilog=info['epilog'],
+        hidden=info['hidden'],
+    )
+
+
+class ManifestCommand(click.Command):
+    """
+    A command rebuilt from a manifest, which defers to the real command
+    for anything other than help and completion.
+
+    """
+
+    def __init__(self, loader, **kwargs):
+        super(ManifestCommand, self).__init__(**kwargs)
+        self.loader = loader
+        self.raw_args = None
+
+    def parse_args(self, ctx, args):
+        self.raw_args = list(args)
+        if ctx.resilient_parsing or self._wants_help(ctx, args):
+            return super(ManifestCommand, self).parse_args(ctx, args)
+        # The real command will parse the arguments; parsing them here
+        # would skip its callbacks and could reject valid input.
+        return []
+
+    def _wants_help(self, ctx, args):
+        """
+        Return whether `args` ask for help, as an option rather than, say,
+        the value of another option or an argument after `--`.
+
+        """
+        help_option = self.get_help_option(ctx)
+        if help_option is None:
+            return False
+        try:
+            opts, _, _ = self.make_parser(ctx).parse_args(list(args))
+        except click.UsageError:
+            # the real command will report it
+            return False
+        return help_option.name in opts
+
+    def invoke(self, ctx):
+        command = self.loader()
+        with command.make_context(ctx.info_name, self.raw_args,
+                                  parent=ctx.parent) as real_ctx:
+            return command.invoke(real_ctx)
+
+
+def _source_mtimes(module_name, cmd):
+    """
+    Map the source files that determine the schema of `cmd` to their
+    mtimes: the module defining it, and the module of the function it
+    ultimately calls (whose defaults `clickutil.option` reads).
+
+    """
+    module_names = set([module_name])
+    if cmd.callback is not None:
+        target = inspect.unwrap(cmd.callback)
+        module_names.add(getattr(target, '__module__', None))
+    sources = {}
+    for name in module_names:
+        path = getattr(sys.modules.get(name), '__file__', None)
+        if path is not None:
+            sources[path] = os.path.getmtime(path)
+    return sources
+
+
+def _sources_unchanged(sources):
+    for path, mtime in sources.items():
+        try:
+            if os.path.getmtime(path) != mtime:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def _serialize_command(cmd):
+    return {
+        'name': cmd.name,
+        'help': cmd.help,
+        'short_help': cmd.short_help,
+        'epilog': cmd.epilog,
+        'hidden': cmd.hidden,
+        'params': [_serialize_param(cmd, p) for p in cmd.params],
+    }
+
+
+def _serialize_param(cmd, param):
+    info = {
+        'kind': 'argument' if isinstance(param, click.Argument) else 'option',
+        'name': param.name,
+        'opts': list(param.opts),
+        'secondary_opts': list(param.secondary_opts),
+        'nargs': param.nargs,
+        'multiple': param.multiple,
+        'required': param.required,
+        'metavar': _metavar(cmd, param),
+        'type': _serialize_type(param.type),
+        'complete_with_command': _custom_completion(param),
+    }
+    if isinstance(param, CompletingOption):
+        cache_settings = getattr(param.complete, 'cache_settings', None)
+        if cache_settings is not None:
+            info['completion_cache'] = cache_settings
+    if param.default is not None and param.default is not _UNSET:
+        info['default'] = _jsonable(param.default)
+    if isinstance(param, click.Option):
+        info.update({
+            'help': param.help,
+            'is_flag': param.is_flag,
+            'show_default': param.show_default,
+            'hidden': param.hidden,
+        })
+    return info
+
+
+def _serialize_type(param_type):
+    if isinstance(param_type, click.Choice):
+        return {'name': 'choice', 'choices': list(param_type.choices)}
+    if isinstance(param_type, click.Path):
+        return {'name': 'path', 'file_okay': param_type.file_okay,
+                'dir_okay': param_type.dir_okay,
+                'scandir': isinstance(param_type, ScandirPath)}
+    return {'name': param_type.name}
+
+
+def _custom_completion(param):
+    """
+    Return whether completing `param` needs more than the manifest has: a
+    `shell_complete` callback recorded by `CompletingOption`, or a type
+    which completes differently from the one `_deserialize_type` rebuilds.
+
+    """
+    if isinstance(param, CompletingOption) and param.complete is not None:
+        return True
+    rebuilt = _deserialize_type(_serialize_type(param.type))
+    return (type(param.type).shell_complete is not
+            type(rebuilt).shell_complete)
+
+
+def _deserialize_type(info):
+    if info['name'] == 'choice':
+        return click.Choice(info['choices'])
+    if info['name'] == 'path':
+        path_class = ScandirPath if info['scandir'] else click.Path
+        return path_class(file_okay=info['file_okay'],
+                          dir_okay=info['dir_okay'])
+    if info['name'] == 'boolean':
+        return click.BOOL
+    return click.STRING
+
+
+def _deserialize_param(info, loader):
+    kwargs = {
+        'type': _deserialize_type(info['type']),
+        'nargs': info['nargs'],
+        'required': info['required'],
+        'metavar': info['metavar'],
+    }
+    if info['complete_with_command']:
+        kwargs['shell_complete'] = _complete_with_command(
+            loader, info['name'], info.get('completion_cache'))
+    if 'default' in info:
+        kwargs['default'] = info['default']
+    if info['kind'] == 'argument':
+        return click.Argument([info['name']], **kwargs)
+    decls = list(info['opts'])
+    for i, secondary in enumerate(info['secondary_opts']):
+        decls[i] = '%s/%s' % (decls[i], secondary)
+    if info['is_flag']:
+        del kwargs['type'], kwargs['nargs'], kwargs['metavar']
+        kwargs['is_flag'] = True
+    return click.Option(
+        decls + [info['name']],
+        multiple=info['multiple'],
+        help=info['help'],
+        show_default=info['show_default'],
+        hidden=info['hidden'],
+        **kwargs
+    )
+
+
+def _complete_with_command(loader, name, cache_settings=None):
+    """
+    Return a `shell_complete` callback which completes the parameter
+    `name` of the real command, loading it with `loader()`, unless the
+    parameter's `clickutil.cached_completion` cache has its candidates.
+
+    """
+    def shell_complete(ctx, param, incomplete):
+        if cache_settings is not None:
+            items = _complete_from_cache(ctx, param, incomplete,
+                                         **cache_settings)
+            if items is not None:
+                return items
+        for real_param in loader().params:
+            if real_param.name == name:
+                return real_param.shell_complete(ctx, incomplete)
+        return []
+    return shell_complete
+
+
+def _metavar(cmd, param):
+    ctx = click.Context(cmd)
+    try:
+        return param.make_metavar(ctx)
+    except TypeError:  # click < 8.2 takes no context
+        return param.make_metavar()
+
+
+def _jsonable(value):
+    if callable(value):
+        return None
+    if isinstance(value, tuple):
+        value = list(value)
+    try:
+        json.dumps(value)
+    except (TypeError, ValueError):
+        return repr(value)
+    return value
+
+
+def _import_group(path):
+    from .command import _split_path
+    module_name, attr = _split_path(path)
+    return getattr(importlib.import_module(module_name), attr)
+
+
+@click.command('clickutil.manifest')
+@click.argument('group_path')
+@click.argument('manifest_path')
+def _main(group_path, manifest_path):
+    "Write the manifest of the lazy group at GROUP_PATH (module:attr)."
+    write_manifest(_import_group(group_path), manifest_path)
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,456 @@
+"""
+Tools for running many invocations of a command in a process or thread pool.
+"""
+import collections
+import concurrent.futures
+import contextlib
+import io
+import multiprocessing
+import sys
+import threading
+import traceback
+
+import click
+
+from .args import default_option, get_arg_default, required_option
+from .call import deferring_printers, print_deferred
+from .util import mk_decorator, wraps_command
+
+
+EXECUTORS = ('process', 'thread')
+
+JobSettings = collections.namedtuple('JobSettings',
+                                     ['jobs', 'executor', 'ordered'])
+
+_META_KEY = 'clickutil.jobs'
+
+_SERIAL = JobSettings(1, 'process', True)
+
+
+def jobs(default=1, executor='process', ordered=True):
+    """
+    Add a `--jobs N` option controlling how many invocations clickutil
+    runs at once, for commands that run many invocations, such as those
+    decorated with `clickutil.batch` or `clickutil.map_option`.
+
+    Invocations run in forked worker processes (or threads), so the
+    command and its `call` target never need to be pickled, only their
+    inputs and results. Output written by each invocation is captured in
+    the worker and written out by the parent process, so output from
+    different invocations is never interleaved. `use_output` printers
+    run in the parent process, after the rest of their invocation's
+    output is written, so they are given the target's output (which must
+    be picklable) rather than run in the workers. In a `batch`, the first
+    failing invocation cancels any remaining work.
+
+    PARAMETERS
+    ----------
+    default : int
+        Default number of jobs.
+    executor : str
+        Either 'process', for CPU-bound work, or 'thread', for I/O-bound
+        work.
+    ordered : boolean
+        If True, write each invocation's output in input order. Otherwise
+        write it as soon as the invocation completes.
+
+    """
+    if executor not in EXECUTORS:
+        raise ValueError('executor %r is not one of %r'
+                         % (executor, EXECUTORS))
+
+    def store_settings(ctx, param, value):
+        settings = JobSettings(value, executor, ordered)
+        ctx.meta[_META_KEY] = settings
+        for callback in ctx.meta.pop(_PENDING_KEY, ()):
+            callback(settings)
+
+    # eager, so that other eager options (like `--batch`) can use it
+    return mk_decorator(click.option(
+        '--jobs', '-j', cls=_JobsOption, type=click.IntRange(min=1),
+        default=default, show_default=True, expose_value=False,
+        is_eager=True, callback=store_settings,
+        help='number of invocations to run in parallel'
+    ))
+
+
+class _JobsOption(click.Option):
+    pass
+
+
+_PENDING_KEY = 'clickutil.jobs.pending'
+
+
+def get_job_settings(ctx, default=_SERIAL):
+    """
+    Return the `JobSettings` declared by the `jobs` decorator on
+    the command of click context `ctx`, or `default` (by default, serial
+    settings) if there are none.
+
+    """
+    return ctx.meta.get(_META_KEY, default)
+
+
+def with_job_settings(ctx, callback):
+    """
+    Call `callback` with the `JobSettings` of click context `ctx`, as
+    returned by `get_job_settings`, as soon as they are known: right away,
+    or, from the callback of another eager option, once the eager `--jobs`
+    option has been processed.
+
+    """
+    has_jobs = any(isinstance(param, _JobsOption)
+                   for param in ctx.command.params)
+    if has_jobs and _META_KEY not in ctx.meta:
+        ctx.meta.setdefault(_PENDING_KEY, []).append(callback)
+    else:
+        callback(get_job_settings(ctx))
+
+
+def map_option(flag, short_flag, type, help):
+    """
+    Like `clickutil.option`, but the option takes multiple values, and the
+    decorated function (usually a `call` or `use_output` wrapper) is
+    called once per value, with that value as its argument. The target
+    itself is unchanged and still takes a single value.
+
+    Calls run in parallel according to `clickutil.jobs`, if the command
+    uses it, with the same output capturing as for `clickutil.batch`: the
+    workers call the target, and this process calls the `use_output`
+    printer with each result, in the order of the values or, with
+    `ordered=False`, as soon as each call completes. A failing call
+    doesn't stop the others: its traceback is written along with its
+    output, and once every call is done a `MapError` listing the failures
+    is raised, which click reports with exit status 1.
+
+    The decorated function returns the list of results, in the order of
+    the values, with None for failed calls. If the option is not given
+    and the target has a default for it, the function is called once,
+    with that default.
+
+    PARAMETERS
+    ----------
+    flag : str
+    short_flag : {str, None}
+    type : any click arg type, or a dict as for `clickutil.option`
+        The type of a single value.
+    help : str
+
+    EXAMPLE
+    -------
+
+    >>> @click.command('ping')
+    >>> @clickutil.jobs(8, executor='thread', ordered=False)
+    >>> @clickutil.map_option('--host', None, str, 'hosts to ping')
+    >>> @clickutil.use_output(ping)
+    >>> def _ping(latency):
+            click.echo(latency)
+
+    """
+    varname = flag.strip('-').replace('-', '_')
+    type_info = dict(type) if isinstance(type, dict) else {'type': type}
+    type_info['multiple'] = True
+
+    def decorator(f):
+        has_default, _ = get_arg_default(f, varname)
+        if has_default:
+            add_option = default_option(flag, short_flag, type_info, None,
+                                        help)
+        else:
+            add_option = required_option(flag, short_flag, type_info, help)
+
+        @add_option
+        @wraps_command(f)
+        def wrapped(*args, **kwargs):
+            values = kwargs.pop(varname)
+            if not values:
+                return [f(*args, **kwargs)]
+            ctx = click.get_current_context(silent=True)
+            return _map_values(f, varname, values, args, kwargs, ctx, flag)
+
+        return wrapped
+
+    return decorator
+
+
+class MapError(click.ClickException):
+    """
+    Raised by functions decorated with `map_option` when calls for some
+    of the option's values failed.
+
+    ATTRIBUTES
+    ----------
+    failures : list of (value, str) tuples
+        The failed values and a one-line description of each error.
+    results : list
+        The results of all calls, with None for the failed ones.
+
+    """
+
+    def __init__(self, flag, total, failures, results):
+        lines = ['%d of %d values of %s failed:' % (len(failures), total,
+                                                    flag)]
+        lines.extend('  %s: %s' % (value, error) for value, error in failures)
+        super(MapError, self).__init__('\n'.join(lines))
+        self.failures = failures
+        self.results = results
+
+
+def _map_values(f, varname, values, args, kwargs, ctx, flag):
+    """
+    Call `f` once per value of `varname` in `values`, in click context
+    `ctx` (if any), and return the results in order, raising a `MapError`
+    if any calls failed.
+
+    """
+    settings = get_job_settings(ctx) if ctx else _SERIAL
+
+    def call_one(indexed_value):
+        i, value = indexed_value
+        call_kwargs = dict(kwargs)
+        call_kwargs[varname] = value
+        # worker threads have no current click context of their own
+        scope = (ctx.scope(cleanup=False) if ctx
+                 else contextlib.nullcontext())
+        try:
+            with scope:
+                return i, True, f(*args, **call_kwargs)
+        except Exception as e:
+            click.echo(traceback.format_exc(), err=True, nl=False)
+            return i, False, _describe(e)
+
+    def print_one(outcome, outputs):
+        i, ok, _ = outcome
+        if not ok:
+            return outcome
+        try:
+            print_deferred(outputs)
+        except Exception as e:
+            click.echo(traceback.format_exc(), err=True, nl=False)
+            return i, False, _describe(e)
+        return outcome
+
+    items = enumerate(values)
+    if settings.jobs > 1:
+        outcomes = (print_one(outcome, outputs) for outcome, outputs
+                    in run_invocations(call_one, items, settings))
+    else:
+        outcomes = (call_one(item) for item in items)
+
+    results = [None] * len(values)
+    errors = {}
+    for i, ok, outcome in outcomes:
+        if ok:
+            results[i] = outcome
+        else:
+            errors[i] = outcome
+    if errors:
+        raise MapError(flag, len(values),
+                       [(values[i], errors[i]) for i in sorted(errors)],
+                       results)
+    return results
+
+
+def _describe(e):
+    if isinstance(e, click.ClickException):
+        return e.format_message()
+    return '%s: %s' % (e.__class__.__name__, e)
+
+
+def run_invocations(func, items, settings):
+    """
+    Call `func(item)` for each of `items` with `run_parallel`, according to
+    `JobSettings` `settings`, writing out the output of each call, and
+    yielding `(result, outputs)` tuples where `outputs` are the outputs of
+    the `use_output` wrappers called by `func`, which the caller prints
+    with `clickutil.call.print_deferred`.
+
+    """
+    results = run_parallel(deferring_printers(func), items, settings.jobs,
+                           settings.executor, settings.ordered,
+                           capture_output=True)
+    try:
+        for result, out, err in results:
+            click.echo(out, nl=False)
+            click.echo(err, nl=False, err=True)
+            yield result
+    finally:
+        results.close()
+
+
+def run_parallel(func, items, jobs, executor='process', ordered=True,
+                 capture_output=False):
+    """
+    Call `func(item)` for each of `items` in a pool of `jobs` workers,
+    yielding the results.
+
+    At most a few items per worker are in flight at once, so `items` may be
+    a long (or lazy) iterable. If any call raises, the remaining calls are
+    cancelled and the exception propagates. The same happens if the caller
+    stops iterating early.
+
+    PARAMETERS
+    ----------
+    func : function
+        The function to call. In a process pool, `func` is inherited by the
+        workers by forking, so only `items` and the results need to be
+        picklable.
+    items : iterable
+        Inputs to `func`.
+    jobs : int
+        Number of workers.
+    executor : str
+        Either 'process' or 'thread'.
+    ordered : boolean
+        Whether to yield results in the order of `items`, or as they
+        complete.
+    capture_output : boolean
+        If True, capture anything `func` writes to stdout or stderr
+        (including to their binary `buffer`s), and yield
+        `(result, stdout, stderr)` tuples instead of results. The output
+        is a str, or bytes if it isn't valid UTF-8.
+
+    """
+    if executor not in EXECUTORS:
+        raise ValueError('executor %r is not one of %r'
+                         % (executor, EXECUTORS))
+    if capture_output:
+        func = _capturing(func)
+    if executor == 'process':
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise ValueError('process executor requires fork, which is not '
+                             'available on this platform')
+        key = id(func)
+        _FORKED_FUNCS[key] = func
+        pool = concurrent.futures.ProcessPoolExecutor(
+            jobs, mp_context=multiprocessing.get_context('fork'))
+        submit = lambda item: pool.submit(_call_forked, key, item)  # noqa
+    else:
+        key = None
+        pool = concurrent.futures.ThreadPoolExecutor(jobs)
+        submit = lambda item: pool.submit(func, item)  # noqa
+
+    window = 2 * jobs
+    pending = collections.deque()
+    try:
+        with _capturable_streams(capture_output):
+            for item in items:
+                pending.append(submit(item))
+                if len(pending) >= window:
+                    for result in _drain(pending, ordered, window - 1):
+                        yield result
+            for result in _drain(pending, ordered, 0):
+                yield result
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
+        _FORKED_FUNCS.pop(key, None)
+
+
+def _drain(pending, ordered, keep):
+    """
+    Yield results from `pending` futures until at most `keep` remain.
+
+    """
+    while len(pending) > keep:
+        if ordered:
+            future = pending.popleft()
+        else:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            future = done.pop()
+            pending.remove(future)
+        yield future.result()
+
+
+# Functions handed to forked workers, keyed by id. Workers inherit this
+# dict when they fork, so the functions themselves are never pickled.
+_FORKED_FUNCS = {}
+
+
+def _call_forked(key, item):
+    return _FORKED_FUNCS[key](item)
+
+
+_captured = threading.local()
+
+
+class _CapturingStream(object):
+    """
+    Stand-in for sys.stdout or sys.stderr which sends writes from threads
+    that are capturing output into a per-thread buffer, and everything
+    else to the original stream.
+
+    """
+
+    def __init__(self, stream, name):
+        self._stream = stream
+        self._name = name
+
+    def _target(self):
+        buffers = getattr(_captured, 'buffers', None)
+        if buffers is None:
+            return self._stream
+        return buffers[self._name]
+
+    def write(self, s):
+        return self._target().write(s)
+
+    def flush(self):
+        return self._target().flush()
+
+    @property
+    def buffer(self):
+        return self._target().buffer
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _capturable_streams(object):
+    """
+    Context manager which, if `enabled`, swaps in `_CapturingStream`s for
+    sys.stdout and sys.stderr. Forked workers inherit the swapped streams.
+
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+
+    def __enter__(self):
+        if self.enabled:
+            self.saved = sys.stdout, sys.stderr
+            sys.stdout = _CapturingStream(sys.stdout, 'stdout')
+            sys.stderr = _CapturingStream(sys.stderr, 'stderr')
+
+    def __exit__(self, *exc_info):
+        if self.enabled:
+            sys.stdout, sys.stderr = self.saved
+
+
+def _capturing(func):
+    def wrapped(item):
+        # text and binary writes both end up in the bytes, in order
+        _captured.buffers = buffers = {
+            'stdout': io.TextIOWrapper(io.BytesIO(), encoding='utf-8',
+                                       newline='\n', write_through=True),
+            'stderr': io.TextIOWrapper(io.BytesIO(), encoding='utf-8',
+                                       newline='\n', write_through=True),
+        }
+        try:
+            result = func(item)
+            return (result,
+                    _captured_value(buffers['stdout']),
+                    _captured_value(buffers['stderr']))
+        finally:
+            _captured.buffers = None
+    return wrapped
+
+
+def _captured_value(stream):
+    data = stream.buffer.getvalue()
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data
@@ -0,0 +1,317 @@
+import collections
+import cProfile
+import json
+import os
+import pstats
+import signal
+import sys
+import threading
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+import click
+
+from .args import boolean_flag, default_option
+from .util import wraps_command
+
+
+def profile(default=False, sort='cumulative', limit=20):
+    """
+    Add a click handler to run the command under cProfile. You can
+    toggle this on and off using the --profile/--no-profile flag; the
+    default value is controlled by the `default` parameter. Passing
+    --profile-output PATH also turns profiling on, and writes a pstats
+    dump to PATH which can be loaded with `pstats` or tools like
+    `snakeviz`.
+
+    When profiling is on, a summary of the top functions is printed
+    to stderr after the command finishes (even if it raises). When it is
+    off, the command is called directly.
+
+    PARAMETERS
+    ----------
+    default : boolean
+        Default value of the profile flag.
+    sort : str
+        The `pstats` sort key for the summary, e.g. 'cumulative',
+        'tottime' or 'calls'.
+    limit : int
+        How many functions to include in the summary.
+
+    """
+    def decorator(f):
+
+        @boolean_flag(
+            '--profile', default=default,
+            help='run under cProfile and print a summary to stderr?'
+        )
+        @default_option(
+            '--profile-output', None,
+            click.Path(dir_okay=False, writable=True), None,
+            help='write a pstats dump to this file (implies --profile)'
+        )
+        @wraps_command(f)
+        def wrapped(profile, profile_output, *args, **kwargs):
+            if not (profile or profile_output):
+                return f(*args, **kwargs)
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(f, *args, **kwargs)
+            finally:
+                _report(profiler, profile_output, sort, limit)
+
+        return wrapped
+
+    return decorator
+
+
+def _report(profiler, output, sort, limit):
+    stats = pstats.Stats(profiler, stream=sys.stderr)
+    if output is not None:
+        stats.dump_stats(output)
+    stats.sort_stats(sort).print_stats(limit)
+
+
+def sample_profile(default_hz=100, threads=False):
+    """
+    Add a click handler to profile the command with a low-overhead
+    statistical sampler. Passing --sample-profile (or
+    --sample-profile=HZ to set the sampling frequency) samples the
+    call stack on a CPU-time interval timer while the command runs, and
+    writes the samples in the "collapsed stack" format understood by
+    flamegraph tools (e.g. `flamegraph.pl` or `speedscope`) to stderr,
+    or to the file given by --sample-profile-output.
+
+    Unlike `profile`, this doesn't trace every call, so hot loops run at
+    close to full speed. It requires `signal.setitimer`, which is not
+    available on Windows, and must run in the main thread. When the
+    flag is not passed, the command is called directly.
+
+    PARAMETERS
+    ----------
+    default_hz : int
+        Sampling frequency used when --sample-profile is given without
+        a value.
+    threads : boolean
+        If True, sample every thread's stack, rather than only that of
+        the main thread.
+
+    """
+    def decorator(f):
+
+        @click.option(
+            '--sample-profile', type=click.IntRange(min=1), default=None,
+            is_flag=False, flag_value=default_hz,
+            help='sample stacks at HZ (default %d) and write collapsed '
+                 'stacks for flamegraphs' % default_hz
+        )
+        @default_option(
+            '--sample-profile-output', None,
+            click.Path(dir_okay=False, writable=True), None,
+            help='write collapsed stacks to this file instead of stderr'
+        )
+        @wraps_command(f)
+        def wrapped(sample_profile, sample_profile_output, *args, **kwargs):
+            if sample_profile is None:
+                return f(*args, **kwargs)
+            sampler = _StackSampler(sample_profile, threads)
+            sampler.start()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                sampler.stop()
+                if sample_profile_output is None:
+                    sampler.write_collapsed(sys.stderr)
+                else:
+                    with open(sample_profile_output, 'w') as stream:
+                        sampler.write_collapsed(stream)
+
+        return wrapped
+
+    return decorator
+
+
+class _StackSampler(object):
+    """
+    Count the call stacks seen on each tick of a SIGPROF interval timer.
+
+    """
+
+    def __init__(self, hz, threads=False):
+        self.interval = 1.0 / hz
+        self.threads = threads
+        self.stacks = collections.Counter()
+        self._labels = {}
+        self._main_ident = threading.main_thread().ident
+
+    def start(self):
+        if not hasattr(signal, 'setitimer'):
+            raise click.UsageError('--sample-profile requires '
+                                   'signal.setitimer, which is not '
+                                   'available on this platform')
+        if threading.current_thread() is not threading.main_thread():
+            raise click.UsageError('--sample-profile can only be used from '
+                                   'the main thread')
+        self._old_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._old_handler)
+
+    def write_collapsed(self, stream):
+        for stack, count in sorted(self.stacks.items()):
+            stream.write('%s %d\n' % (stack, count))
+
+    def _sample(self, signum, frame):
+        if not self.threads:
+            self.stacks[self._collapse(frame)] += 1
+            return
+        for ident, thread_frame in sys._current_frames().items():
+            if ident == self._main_ident:
+                # skip this signal handler's own frame
+                thread_frame = frame
+            self.stacks[self._collapse(thread_frame)] += 1
+
+    def _collapse(self, frame):
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = '%s (%s:%d)' % (
+                    code.co_name, os.path.basename(code.co_filename),
+                    code.co_firstlineno
+                )
+            labels.append(label)
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+
+def memprofile(default=False, limit=10, diff=True):
+    """
+    Add a click handler to trace memory allocations of the command with
+    `tracemalloc`. You can toggle this on and off using the
+    --memprofile/--no-memprofile flag; the default value is controlled by
+    the `default` parameter. Passing --memprofile-output PATH also turns
+    memory profiling on, and writes the report as JSON to PATH, for
+    tracking memory use across runs.
+
+    When memory profiling is on, after the command finishes (even if it
+    raises) we print to stderr the peak RSS of the process, the current
+    and peak memory traced by `tracemalloc`, and the top allocation sites
+    by file and line. Note that tracemalloc slows down allocation-heavy
+    code considerably. When it is off, the command is called directly.
+
+    PARAMETERS
+    ----------
+    default : boolean
+        Default value of the memprofile flag.
+    limit : int
+        How many allocation sites to report.
+    diff : boolean
+        If True, report the allocation sites which grew the most between
+        the start and end of the command. Otherwise, report the largest
+        allocation sites still alive at the end.
+
+    """
+    def decorator(f):
+
+        @boolean_flag(
+            '--memprofile', default=default,
+            help='trace memory allocations and print the top sites '
+                 'to stderr?'
+        )
+        @default_option(
+            '--memprofile-output', None,
+            click.Path(dir_okay=False, writable=True), None,
+            help='write the memory report as JSON to this file '
+                 '(implies --memprofile)'
+        )
+        @wraps_command(f)
+        def wrapped(memprofile, memprofile_output, *args, **kwargs):
+            if not (memprofile or memprofile_output):
+                return f(*args, **kwargs)
+            was_tracing = tracemalloc.is_tracing()
+            if not was_tracing:
+                tracemalloc.start()
+            start = _snapshot()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                report = _memory_report(start, _snapshot(), limit, diff)
+                if not was_tracing:
+                    tracemalloc.stop()
+                _print_memory_report(report)
+                if memprofile_output is not None:
+                    with open(memprofile_output, 'w') as stream:
+                        json.dump(report, stream, indent=2)
+
+        return wrapped
+
+    return decorator
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+    ])
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS but kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _memory_report(start, end, limit, diff):
+    current, peak = tracemalloc.get_traced_memory()
+    if diff:
+        stats = end.compare_to(start, 'lineno')
+    else:
+        stats = end.statistics('lineno')
+    top = []
+    for stat in stats[:limit]:
+        frame = stat.traceback[0]
+        site = {'file': frame.filename, 'line': frame.lineno,
+                'size_bytes': stat.size, 'count': stat.count}
+        if diff:
+            site['size_diff_bytes'] = stat.size_diff
+            site['count_diff'] = stat.count_diff
+        top.append(site)
+    return {'peak_rss_bytes': _peak_rss_bytes(),
+            'traced_current_bytes': current,
+            'traced_peak_bytes': peak,
+            'top': top}
+
+
+def _print_memory_report(report):
+    click.echo('peak RSS: %s' % _format_bytes(report['peak_rss_bytes']),
+               err=True)
+    click.echo('traced memory: %s current, %s peak' % (
+        _format_bytes(report['traced_current_bytes']),
+        _format_bytes(report['traced_peak_bytes'])), err=True)
+    click.echo('top allocation sites:', err=True)
+    for site in report['top']:
+        line = '  %s:%d: %s in %d blocks' % (
+            site['file'], site['line'], _format_bytes(site['size_bytes']),
+            site['count'])
+        if 'size_diff_bytes' in site:
+            line += ' (%+d bytes)' % site['size_diff_bytes']
+        click.echo(line, err=True)
+
+
+def _format_bytes(n):
+    if n is None:
+        return 'unknown'
+    for unit in ['B', 'KiB', 'MiB']:
+        if abs(n) < 1024:
+            return '%.1f %s' % (n, unit)
+        n /= 1024.0
+    return '%.1f GiB' % n
@@ -0,0 +1,399 @@
+"""
+Serve a click command from a long-lived, pre-imported process, so that
+invocations pay for a fork rather than for interpreter startup and imports.
+
+The server listens on a local Unix socket. A client sends its argv, working
+directory and environment, along with its actual stdin, stdout and stderr
+file descriptors, so the command reads and writes the client's streams
+directly. The server forks a child per invocation, which runs the command
+and sends back its exit status.
+
+For example, start a server with
+
+    python -m clickutil.server serve mypkg.cli:_cli /tmp/mypkg.sock
+
+and then run commands through it with
+
+    python -m clickutil.server run /tmp/mypkg.sock do-something --an-option 3
+
+As an alternative to a socket server, `zygote` reads argument lines from a
+file or FIFO and forks a child per line.
+
+Both import any declared heavy modules up front and then call `gc.freeze`,
+so that the imported objects stay in pages shared copy-on-write with the
+children, rather than being copied when the garbage collector touches them.
+
+This requires a platform with Unix sockets and `os.fork`.
+
+"""
+import gc
+import importlib
+import itertools
+import json
+import os
+import signal
+import socket
+import stat
+import struct
+import sys
+import traceback
+
+import click
+
+from .batch import _line_to_args, _numbered_lines
+from .command import _split_path
+
+
+_INT = struct.Struct('!i')
+
+
+def serve(command, socket_path, prog_name=None, preload=(),
+          child_gc=True):
+    """
+    Serve `command` on a Unix socket at `socket_path` until interrupted.
+
+    PARAMETERS
+    ----------
+    command : click.Command
+        The command (often a group) to run for each client.
+    socket_path : str
+        Where to create the socket. A stale socket left behind by a
+        server that died is replaced, but a live one is an error.
+    prog_name : {str, None}
+        The program name shown in usage messages. Defaults to the name
+        of `command`.
+    preload : list of str
+        Modules to import before serving, so children don't have to.
+    child_gc : boolean
+        If False, disable the cyclic garbage collector in children, which
+        saves time and memory for short-lived commands.
+
+    """
+    prog_name = prog_name or command.name
+    _preload(preload)
+    listener = _listen(socket_path)
+    try:
+        while True:
+            _reap_children()
+            try:
+                conn, _ = listener.accept()
+            except socket.timeout:
+                continue
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                listener.close()
+                _run_child(conn, command, prog_name, child_gc)
+            conn.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        os.unlink(socket_path)
+
+
+def zygote(command, queue_path, prog_name=None, preload=(),
+           max_children=None, child_gc=False):
+    """
+    Run `command` once per line of `queue_path`, each time in a child
+    forked from this process, and return 1 if any of them failed, else 0.
+
+    Lines have the same format as for `clickutil.batch`. If `queue_path` is
+    a FIFO, we keep reading from it (reopening it whenever all writers
+    have closed it) until interrupted, so other processes can submit
+    commands by writing lines to it.
+
+    The exit status of each line is reported on stderr. Children share this
+    process's standard streams.
+
+    PARAMETERS
+    ----------
+    command : click.Command
+        The command (often a group) to run for each line.
+    queue_path : str
+        A file or FIFO to read lines from, or `-` for stdin.
+    prog_name : {str, None}
+        See `serve`.
+    preload : list of str
+        See `serve`.
+    max_children : {int, None}
+        How many children may run at once. Defaults to the number of CPUs.
+    child_gc : boolean
+        See `serve`. Defaults to False, since the point of a zygote is to
+        run many short-lived commands.
+
+    """
+    prog_name = prog_name or command.name
+    max_children = max_children or os.cpu_count() or 1
+    _preload(preload)
+    running = {}
+    failures = 0
+    try:
+        for lineno, line in _queue_lines(queue_path):
+            while len(running) >= max_children:
+                failures += _wait_for_child(running)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                _run_line_child(command, line, prog_name, child_gc)
+            running[pid] = lineno
+    except KeyboardInterrupt:
+        pass
+    finally:
+        while running:
+            failures += _wait_for_child(running)
+    return 1 if failures else 0
+
+
+def _queue_lines(queue_path):
+    if queue_path == '-':
+        yield from _numbered_lines(sys.stdin)
+        return
+    if not stat.S_ISFIFO(os.stat(queue_path).st_mode):
+        with open(queue_path) as queue:
+            yield from _numbered_lines(queue)
+        return
+    # A FIFO hits EOF whenever all of its writers close it, so reopen it to
+    # wait for more lines, numbering them in order of arrival.
+    count = itertools.count(1)
+    while True:
+        with open(queue_path) as queue:
+            for _, line in _numbered_lines(queue):
+                yield next(count), line
+
+
+def _run_line_child(command, line, prog_name, child_gc):
+    status = 1
+    try:
+        if not child_gc:
+            gc.disable()
+        status = _invoke(command, _line_to_args(command, line), prog_name)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(status)
+
+
+def _wait_for_child(running):
+    """
+    Wait for one of the `running` children (a map from pid to line number)
+    to exit, report its status, and return 1 if it failed, else 0.
+
+    """
+    pid, wait_status = os.wait()
+    lineno = running.pop(pid, None)
+    if lineno is None:
+        return 0
+    status = os.waitstatus_to_exitcode(wait_status)
+    click.echo('[zygote] line %d (pid %d): exit status %d'
+               % (lineno, pid, status), err=True)
+    return 1 if status != 0 else 0
+
+
+def _preload(modules):
+    """
+    Import `modules`, then freeze every object that exists so far out of
+    the garbage collector's reach, so forked children don't copy the
+    pages holding them.
+
+    """
+    for module in modules:
+        importlib.import_module(module)
+    gc.collect()
+    gc.freeze()
+
+
+def connect(socket_path, args=None, stdin=None, stdout=None, stderr=None):
+    """
+    Run a command on the server listening at `socket_path`, with this
+    process's working directory, environment and standard streams, and
+    return its exit status.
+
+    PARAMETERS
+    ----------
+    socket_path : str
+        Where the server is listening.
+    args : {list of str, None}
+        The arguments for the command. Defaults to `sys.argv[1:]`.
+    stdin, stdout, stderr : {file, None}
+        Files to use as the command's standard streams. They must have
+        real file descriptors. Default to `sys.stdin` etc.
+
+    RAISES
+    ------
+    OSError
+        If no server is listening at `socket_path`.
+
+    """
+    request = json.dumps({
+        'args': sys.argv[1:] if args is None else list(args),
+        'cwd': os.getcwd(),
+        'env': dict(os.environ),
+    }).encode('utf-8')
+    fds = [(stream or default).fileno() for stream, default in
+           [(stdin, sys.stdin), (stdout, sys.stdout), (stderr, sys.stderr)]]
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        sock.connect(socket_path)
+        socket.send_fds(sock, [_INT.pack(len(request))], fds)
+        sock.sendall(request)
+        pid = _recv_int(sock)
+        try:
+            return _recv_int(sock)
+        except KeyboardInterrupt:
+            os.kill(pid, signal.SIGINT)
+            return _recv_int(sock)
+
+
+def _listen(socket_path):
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        with probe:
+            try:
+                probe.connect(socket_path)
+            except OSError:
+                os.unlink(socket_path)
+            else:
+                raise click.UsageError('a server is already listening on %s'
+                                       % socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(128)
+    # wake up periodically to reap finished children
+    listener.settimeout(1.0)
+    return listener
+
+
+def _reap_children():
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+def _run_child(conn, command, prog_name, child_gc):
+    """
+    Handle one client in a forked child, and exit.
+
+    """
+    status = 1
+    try:
+        if not child_gc:
+            gc.disable()
+        conn.settimeout(None)
+        conn.sendall(_INT.pack(os.getpid()))
+        header, fds, _, _ = socket.recv_fds(conn, _INT.size, 3)
+        request = json.loads(_recv_exactly(conn, _INT.unpack(header)[0]))
+        for target_fd, fd in enumerate(fds):
+            os.dup2(fd, target_fd)
+            os.close(fd)
+        _reopen_std_streams()
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        status = _invoke(command, request['args'], prog_name)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            conn.sendall(_INT.pack(status))
+        finally:
+            os._exit(status)
+
+
+def _reopen_std_streams():
+    """
+    Point sys.stdin etc. at file descriptors 0-2, which the server may have
+    replaced (for example, if it was started under a test runner).
+
+    """
+    sys.stdin = open(0, 'r', closefd=False)
+    sys.stdout = open(1, 'w', buffering=1 if os.isatty(1) else -1,
+                      closefd=False)
+    sys.stderr = open(2, 'w', buffering=1, closefd=False)
+
+
+def _invoke(command, args, prog_name):
+    try:
+        command.main(args=args, prog_name=prog_name, standalone_mode=True)
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        click.echo(e.code, err=True)
+        return 1
+    return 0
+
+
+def _recv_int(sock):
+    return _INT.unpack(_recv_exactly(sock, _INT.size))[0]
+
+
+def _recv_exactly(sock, n):
+    chunks = []
+    while n > 0:
+        chunk = sock.recv(n)
+        if not chunk:
+            raise EOFError('connection closed')
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b''.join(chunks)
+
+
+def _import_command(path):
+    module_name, attr = _split_path(path)
+    return getattr(importlib.import_module(module_name), attr)
+
+
+@click.group('clickutil.server')
+def _main():
+    "Run click commands in a warm, pre-imported server process."
+
+
+@_main.command('serve')
+@click.argument('command_path')
+@click.argument('socket_path')
+@click.option('--preload', multiple=True,
+              help='module to import before serving [multiple]')
+def _serve(command_path, socket_path, preload):
+    "Serve the command at COMMAND_PATH (module:attr) on SOCKET_PATH."
+    serve(_import_command(command_path), socket_path, preload=preload)
+
+
+@_main.command('zygote')
+@click.argument('command_path')
+@click.argument('queue_path')
+@click.option('--preload', multiple=True,
+              help='module to import before forking [multiple]')
+@click.option('--max-children', '-j', type=click.IntRange(min=1),
+              default=None, help='children to run at once [default: #cpus]')
+def _zygote(command_path, queue_path, preload, max_children):
+    "Run COMMAND_PATH (module:attr) once per line of QUEUE_PATH."
+    sys.exit(zygote(_import_command(command_path), queue_path,
+                    preload=preload, max_children=max_children))
+
+
+@_main.command('run', context_settings={'ignore_unknown_options': True,
+                                        'allow_interspersed_args': False})
+@click.argument('socket_path')
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def _run(socket_path, args):
+    "Run a command on the server at SOCKET_PATH with ARGS."
+    sys.exit(connect(socket_path, args))
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,150 @@
+"""
+Split the work of a command deterministically across machines, each of
+which runs the same command with a different `--shard-index`.
+
+Items are assigned to shards by a stable hash (CRC-32) of their value, so
+every machine agrees on the partition without any coordination, and the
+same item always lands in the same shard.
+
+"""
+import zlib
+
+import click
+
+from .files import InputStream
+from .util import mk_decorator, wraps_command
+
+
+def sharded(params=None, key=None, envvar_prefix='CLICKUTIL_SHARD'):
+    """
+    Add `--shard-index` and `--shard-count` options, and pass the target
+    only the items of its iterable arguments which belong to shard
+    `--shard-index` out of `--shard-count`. The options can also be set
+    with environment variables, `CLICKUTIL_SHARD_INDEX` and
+    `CLICKUTIL_SHARD_COUNT` by default.
+
+    By default the filtered arguments are the values of every `multiple`
+    option (which stay tuples) and the lines of every
+    `clickutil.InputStream` option with `lines=True` (which become
+    iterators over the stream's lines). That includes `multiple` options
+    which are settings rather than work, such as a list of tags to apply
+    to every item, so commands with those should name the work in
+    `params`. With the default of a single shard, nothing is filtered.
+    Items are assigned to shards by `shard_of`, which only accepts types
+    with a stable encoding.
+
+    PARAMETERS
+    ----------
+    params : {list of str, None}
+        The names of the arguments to filter, instead of the defaults.
+    key : {function, None}
+        If given, items are assigned to shards by `key(item)` rather than
+        by the item itself, for example to keep all the records of a user
+        in the same shard, or to shard items of other types.
+    envvar_prefix : {str, None}
+        Prefix of the environment variables setting the options. If None,
+        they can only be set on the command line.
+
+    EXAMPLE
+    -------
+
+    >>> @click.command('crawl')
+    >>> @clickutil.sharded()
+    >>> @clickutil.option('--url', None, {'multiple': True, 'type': str},
+                          'urls to crawl')
+    >>> @clickutil.call(crawl)
+    >>> def _crawl(): pass
+
+    """
+    def envvar(name):
+        return None if envvar_prefix is None else envvar_prefix + name
+
+    def decorator(f):
+
+        @mk_decorator(click.option(
+            '--shard-count', type=click.IntRange(min=1), default=1,
+            show_default=True, envvar=envvar('_COUNT'),
+            help='number of shards the work is split into'
+        ))
+        @mk_decorator(click.option(
+            '--shard-index', type=click.IntRange(min=0), default=0,
+            show_default=True, envvar=envvar('_INDEX'),
+            help='which shard of the work to do, counting from 0'
+        ))
+        @wraps_command(f)
+        def wrapped(*args, **kwargs):
+            index = kwargs.pop('shard_index')
+            count = kwargs.pop('shard_count')
+            if index >= count:
+                raise click.BadParameter(
+                    '%d is not less than --shard-count (%d)' % (index, count),
+                    param_hint='--shard-index')
+            if count == 1:
+                return f(*args, **kwargs)
+            names = params
+            if names is None:
+                names = _shardable_params(click.get_current_context())
+            for name in names:
+                value = kwargs.get(name)
+                if value is None:
+                    continue
+                shard_items = in_shard(value, index, count, key)
+                if isinstance(value, (tuple, list)):
+                    shard_items = type(value)(shard_items)
+                kwargs[name] = shard_items
+            return f(*args, **kwargs)
+
+        return wrapped
+
+    return decorator
+
+
+def in_shard(items, index, count, key=None):
+    """
+    Yield the `items` which belong to shard `index` out of `count`, by
+    `shard_of(key(item), count)` if `key` is given.
+
+    """
+    for item in items:
+        if shard_of(item if key is None else key(item), count) == index:
+            yield item
+
+
+def shard_of(item, count):
+    """
+    Return the shard, out of `count`, which `item` belongs to. Strings are
+    hashed as UTF-8, bytes as they are, and numbers, None, and tuples and
+    lists of these by their repr, so the result is the same on every
+    machine and in every run.
+
+    Other types, such as sets, dicts and objects with the default repr,
+    have no such stable encoding, and raise a TypeError; pass a `key`
+    returning one of the types above to shard them.
+
+    """
+    if isinstance(item, str):
+        data = item.encode('utf-8')
+    elif isinstance(item, bytes):
+        data = item
+    elif _has_stable_repr(item):
+        data = repr(item).encode('utf-8')
+    else:
+        raise TypeError('%s items have no stable encoding to shard them by; '
+                        'use a key returning str, bytes or numbers'
+                        % type(item).__name__)
+    return zlib.crc32(data) % count
+
+
+def _has_stable_repr(item):
+    if item is None or type(item) in (bool, int, float, str, bytes):
+        return True
+    if type(item) in (tuple, list):
+        return all(_has_stable_repr(element) for element in item)
+    return False
+
+
+def _shardable_params(ctx):
+    # chunks of a stream that isn't read by lines would split records
+    return [param.name for param in ctx.command.params
+            if param.multiple or (isinstance(param.type, InputStream) and
+                                  param.type.lines)]
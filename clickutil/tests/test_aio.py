@@ -0,0 +1,110 @@
+from __future__ import print_function
+
+import asyncio
+import time
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from ..aio import fan_out, iterate_async, run_async, set_loop_factory
+from ..args import option
+from ..call import use_output
+
+
+def test_fan_out_bounds_concurrency():
+    running = []
+    peak = []
+
+    async def fetch(url, prefix='got'):
+        running.append(url)
+        peak.append(len(running))
+        await asyncio.sleep(0.01 * (url % 3))
+        running.remove(url)
+        return '%s %d' % (prefix, url)
+
+    @click.command('fetch')
+    @option('--url', None, {'multiple': True, 'type': int}, 'urls')
+    @option('--prefix', None, str, 'prefix')
+    @use_output(fan_out(fetch, 'url', concurrency=3))
+    def _fetch(pages):
+        for page in pages:
+            click.echo(page)
+
+    args = []
+    for url in range(10):
+        args.extend(['--url', str(url)])
+    result = CliRunner().invoke(_fetch, args + ['--prefix', 'page'])
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines() == ['page %d' % i for i in range(10)]
+    assert max(peak) == 3
+
+
+def test_fan_out_cancels_on_error():
+    finished = []
+
+    async def work(x):
+        if x == 0:
+            raise ValueError('no zeros')
+        await asyncio.sleep(0.5)
+        finished.append(x)
+
+    start = time.time()
+    with pytest.raises(ValueError):
+        run_async(fan_out(work, 'x', concurrency=4)([1, 2, 0, 3]))
+    assert time.time() - start < 0.4
+    assert finished == []
+
+
+def test_loop_factory():
+    loops = []
+
+    def factory():
+        loop = asyncio.new_event_loop()
+        loops.append(loop)
+        return loop
+
+    async def numbers():
+        yield 1
+        yield 2
+
+    try:
+        set_loop_factory(factory)
+        assert list(iterate_async(numbers())) == [1, 2]
+        assert len(loops) == 1 and loops[0].is_closed()
+    finally:
+        set_loop_factory(None)
+    assert run_async(asyncio.sleep(0, 'done')) == 'done'
+    assert len(loops) == 1
+
+
+def test_run_async_keeps_the_current_loop():
+
+    async def answer():
+        return 42
+
+    async def numbers(n):
+        for i in range(n):
+            yield i
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        assert run_async(answer()) == 42
+        assert list(iterate_async(numbers(2))) == [0, 1]
+        assert asyncio.get_event_loop_policy().get_event_loop() is loop
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def test_run_async_in_a_running_loop():
+
+    async def answer():
+        return 42
+
+    async def nested():
+        with pytest.raises(RuntimeError, match='running event loop'):
+            run_async(answer())
+
+    asyncio.run(nested())
@@ -307,3 +307,13 @@ def test_option_with_multiple_type_yes_default():
     result = runner.invoke(f, ['-mo', '3', '-mo', '4'])
     assert result.exception is None
     assert result.output.strip() == '(3, 4)'
+
+
+def test_get_arg_default_keyword_only():
+
+    def f(x, *, y, z=5): pass
+
+    assert get_arg_default(f, 'y') == (False, None)
+    assert get_arg_default(f, 'z') == (True, 5)
+    with pytest.raises(ValueError):
+        get_arg_default(f, 'w')
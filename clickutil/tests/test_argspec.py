@@ -1,6 +1,7 @@
 from __future__ import print_function
 import functools
 
+from .. import argspec
 from ..argspec import with_argspec, get_argspec, wraps
 
 
@@ -93,3 +94,42 @@ def test_wraps():
     # ...even if the annotations are stacked
     actual = get_argspec(f_kept_args_two_levels).args
     assert actual == good_args
+
+
+def test_get_argspec_fields():
+
+    def f(x, y=3, *args, z, w=4, **kwargs): pass
+
+    argspec = get_argspec(f)
+    assert argspec.args == ['x', 'y']
+    assert argspec.varargs == 'args'
+    assert argspec.keywords == 'kwargs'
+    assert argspec.defaults == (3,)
+    assert argspec.kwonlyargs == ['z', 'w']
+    assert argspec.arg_defaults == {'y': 3, 'w': 4}
+
+    def g(x): pass
+    assert get_argspec(g).defaults is None
+
+
+def test_get_argspec_is_cached(monkeypatch):
+    calls = []
+    compute_argspec = argspec._compute_argspec
+
+    def counting_compute_argspec(f):
+        calls.append(f)
+        return compute_argspec(f)
+
+    monkeypatch.setattr(argspec, '_compute_argspec',
+                        counting_compute_argspec)
+
+    def f(x, y=3): pass
+
+    assert get_argspec(f) is get_argspec(f)
+    assert len(calls) == 1
+
+    # wrapping with clickutil decorators reuses the same argspec
+    @wraps(f)
+    def wrapper(*args, **kwargs): pass
+    assert get_argspec(wrapper) is get_argspec(f)
+    assert len(calls) == 1
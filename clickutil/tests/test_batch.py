@@ -0,0 +1,92 @@
+from __future__ import print_function
+
+import click
+from click.testing import CliRunner
+
+from ..args import option, boolean
+from ..batch import batch
+from ..call import call
+
+
+def make_command():
+    calls = []
+
+    def f(name, count=1, loud=False):
+        if name == 'bad':
+            raise ValueError('bad name')
+        calls.append((name, count, loud))
+        click.echo('%s %s %s' % (name, count, loud))
+
+    @click.command('f')
+    @batch()
+    @option('--name', None, str, 'a name')
+    @option('--count', '-n', int, 'a count')
+    @boolean('--loud', 'be loud')
+    @call(f)
+    def _f(): pass
+
+    return _f, calls
+
+
+def test_batch_runs_each_line():
+    command, calls = make_command()
+    lines = '\n'.join([
+        "--name 'a b' -n 2",
+        "",
+        "# a comment",
+        '{"name": "c", "count": 3, "loud": true}',
+        '{"name": "d", "loud": false}',
+    ])
+    result = CliRunner().invoke(command, ['--batch', '-'], input=lines)
+    assert result.exit_code == 0
+    assert calls == [('a b', 2, False), ('c', 3, True), ('d', 1, False)]
+    assert '[batch] line 1: exit status 0' in result.output
+
+
+def test_batch_reports_failures():
+    command, calls = make_command()
+    lines = '\n'.join([
+        '--name a',
+        '--name bad',
+        '--count notanint',
+        '{"nonsense": 1}',
+        '--name b',
+    ])
+    result = CliRunner().invoke(command, ['--batch', '-'], input=lines)
+    assert result.exit_code == 1
+    assert calls == [('a', 1, False), ('b', 1, False)]
+    assert '[batch] line 1: exit status 0' in result.output
+    assert '[batch] line 2: exit status 1' in result.output
+    assert 'ValueError: bad name' in result.output
+    assert '[batch] line 3: exit status 2' in result.output
+    assert '[batch] line 4: exit status 2' in result.output
+    assert '[batch] line 5: exit status 0' in result.output
+
+
+def test_no_batch_runs_normally():
+    command, calls = make_command()
+    result = CliRunner().invoke(command, ['--name', 'a'])
+    assert result.exit_code == 0
+    assert calls == [('a', 1, False)]
+
+
+def test_batch_ignores_other_arguments():
+    command, calls = make_command()
+    result = CliRunner().invoke(command, ['--name', 'a', '--count', 'x',
+                                          '--batch', '-'], input='--name b')
+    assert result.exit_code == 0
+    assert calls == [('b', 1, False)]
+    del calls[:]
+
+    result = CliRunner().invoke(command, ['--help', '--batch', '-'])
+    assert result.exit_code == 0
+    assert result.output.startswith('Usage:')
+
+    # options are still required on batch lines, and without a batch
+    result = CliRunner().invoke(command, ['--batch', '-'],
+                                input='--count 2\n--name a')
+    assert result.exit_code == 1
+    assert "Missing option '--name'" in result.output
+    assert calls == [('a', 1, False)]
+    result = CliRunner().invoke(command, [])
+    assert result.exit_code == 2
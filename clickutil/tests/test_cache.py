@@ -0,0 +1,266 @@
+from __future__ import print_function
+
+import functools
+import os
+import subprocess
+import sys
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from ..args import EXISTING_FILE, option
+from ..cache import cached, cached_call, incremental
+from ..call import use_output
+from ..parallel import jobs, map_option
+
+
+# Targets record their calls in a global, since results are keyed on the
+# values of the variables that targets' closures refer to.
+CALLS = []
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    del CALLS[:]
+
+
+def make_counted():
+
+    def count_lines(path, scale=1):
+        CALLS.append(path)
+        with open(path) as f:
+            return scale * len(f.readlines())
+
+    return count_lines
+
+
+def test_cached_call_skips_repeated_work(tmpdir):
+    data = tmpdir.join('data.txt')
+    data.write('a\nb\n')
+
+    @click.command('count')
+    @option('--path', None, EXISTING_FILE, 'the file')
+    @option('--scale', None, int, 'multiplier')
+    @use_output(cached(make_counted(), cache_dir=str(tmpdir.join('c'))))
+    def _count(output):
+        click.echo(output)
+
+    runner = CliRunner()
+    args = ['--path', str(data)]
+    assert runner.invoke(_count, args).output == '2\n'
+    assert runner.invoke(_count, args).output == '2\n'
+    assert len(CALLS) == 1
+
+    assert runner.invoke(_count, args + ['--scale', '3']).output == '6\n'
+    assert len(CALLS) == 2
+
+    # changing an input file invalidates its results
+    data.write('a\nb\nc\n')
+    os.utime(str(data), ns=(0, 0))
+    assert runner.invoke(_count, args).output == '3\n'
+    assert len(CALLS) == 3
+
+
+def test_cached_hash_contents(tmpdir):
+    data = tmpdir.join('data.txt')
+    data.write('a\n')
+    count_lines = cached(make_counted(), cache_dir=str(tmpdir.join('c')),
+                         hash_contents=True, path_args=['path'])
+    assert count_lines(str(data)) == 1
+    os.utime(str(data), ns=(0, 0))
+    assert count_lines(path=str(data)) == 1
+    assert len(CALLS) == 1
+    data.write('a\nb\n')
+    assert count_lines(str(data)) == 2
+    assert len(CALLS) == 2
+
+
+def test_cached_iterators_and_unpicklable_arguments(tmpdir):
+
+    def numbers(n, transform=None):
+        CALLS.append(n)
+        for i in range(n):
+            yield transform(i) if transform else i
+
+    f = cached(numbers, cache_dir=str(tmpdir))
+    assert list(f(3)) == [0, 1, 2]
+    assert list(f(3)) == [0, 1, 2]
+    assert CALLS == [3]
+    assert list(f(2, lambda i: -i)) == [0, -1]
+    assert list(f(2, lambda i: -i)) == [0, -1]
+    assert CALLS == [3, 2, 2]
+
+
+def test_cached_evicts_least_recently_used(tmpdir):
+    cache_dir = str(tmpdir)
+
+    def blob(i):
+        return 'x' * 1000
+
+    f = cached(blob, cache_dir=cache_dir, max_bytes=2500)
+    f(1)
+    f(2)
+    os.utime(tmpdir.listdir()[0].strpath, ns=(0, 0))
+    oldest = min(tmpdir.listdir(), key=lambda p: p.mtime())
+    f(3)
+    assert len(tmpdir.listdir()) == 2
+    assert not oldest.exists()
+
+    # results bigger than the whole cache are not stored
+    cached(lambda: 'x' * 5000, cache_dir=str(tmpdir.join('big')),
+           max_bytes=2500)()
+    assert not tmpdir.join('big').exists()
+
+
+def test_cached_call_keeps_defaults(tmpdir):
+
+    @click.command('count')
+    @option('--x', None, int, 'a number')
+    @cached_call(lambda x=4: CALLS.append(x) or x, cache_dir=str(tmpdir))
+    def _count(): pass
+
+    runner = CliRunner()
+    runner.invoke(_count, [])
+    runner.invoke(_count, [])
+    runner.invoke(_count, ['--x', '4'])
+    assert CALLS == [4]
+    runner.invoke(_count, ['--x', '5'])
+    assert CALLS == [4, 5]
+
+
+def test_cached_distinguishes_targets(tmpdir):
+    f = cached(lambda: 1, cache_dir=str(tmpdir))
+    g = cached(lambda: 2, cache_dir=str(tmpdir))
+    assert (f(), g()) == (1, 2)
+
+
+def test_cached_distinguishes_closures_and_partials(tmpdir):
+
+    def make(scale):
+        return lambda x: x * scale
+
+    assert cached(make(2), cache_dir=str(tmpdir))(10) == 20
+    assert cached(make(3), cache_dir=str(tmpdir))(10) == 30
+
+    def scaled(x, scale):
+        return x * scale
+
+    assert cached(functools.partial(scaled, scale=2),
+                  cache_dir=str(tmpdir))(10) == 20
+    assert cached(functools.partial(scaled, scale=3),
+                  cache_dir=str(tmpdir))(10) == 30
+
+    # closures over things which can't be pickled aren't cached
+    makers = []
+    f = cached(lambda: makers.append(make) or len(makers),
+               cache_dir=str(tmpdir))
+    assert (f(), f()) == (1, 2)
+
+
+def test_cached_finds_paths_without_a_command(tmpdir):
+    data = tmpdir.join('data.txt')
+    data.write('a\n')
+    count_lines = cached(make_counted(), cache_dir=str(tmpdir.join('c')))
+    assert count_lines(str(data)) == 1
+    assert count_lines(str(data)) == 1
+    assert len(CALLS) == 1
+    data.write('a\nb\n')
+    os.utime(str(data), ns=(0, 0))
+    assert count_lines(str(data)) == 2
+    assert len(CALLS) == 2
+
+
+def test_cached_in_map_option_threads(tmpdir):
+    data = tmpdir.join('data.txt')
+    data.write('a\n')
+
+    @click.command('count')
+    @jobs(2, executor='thread')
+    @map_option('--scale', None, int, 'multipliers')
+    @option('--path', None, EXISTING_FILE, 'the file')
+    @use_output(cached(make_counted(), cache_dir=str(tmpdir.join('c'))))
+    def _count(output):
+        click.echo(output)
+
+    runner = CliRunner()
+    args = ['--path', str(data), '--scale', '1', '--scale', '2', '-j', '2']
+    assert runner.invoke(_count, args).output == '1\n2\n'
+    assert runner.invoke(_count, args).output == '1\n2\n'
+    assert len(CALLS) == 2
+    data.write('a\nb\n')
+    os.utime(str(data), ns=(0, 0))
+    assert runner.invoke(_count, args).output == '2\n4\n'
+    assert len(CALLS) == 4
+
+
+def test_cache_keys_dont_depend_on_hash_seed():
+    code = ('from clickutil.cache import _digest; '
+            'print(_digest(len, {"a": frozenset("x%d" % i for i in range(20)),'
+            ' "b": [set(["y", "z"])]}))')
+    keys = set()
+    for seed in ['1', '2', '3']:
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        keys.add(subprocess.check_output([sys.executable, '-c', code],
+                                         env=env))
+    assert len(keys) == 1
+
+
+def test_incremental_only_processes_changed_files(tmpdir):
+    paths = []
+    for i in range(4):
+        path = tmpdir.join('%d.txt' % i)
+        path.write('x\n' * i)
+        paths.append(str(path))
+
+    def count_lines(path, scale=1):
+        CALLS.append(list(path))
+        return dict((p, scale * len(open(p).readlines())) for p in path)
+
+    @click.command('count')
+    @option('--path', None, {'multiple': True, 'type': EXISTING_FILE},
+            'the files')
+    @option('--scale', None, int, 'multiplier')
+    @use_output(incremental(count_lines, 'path',
+                            index_dir=str(tmpdir.join('index'))))
+    def _count(output):
+        click.echo(' '.join(str(output[p]) for p in sorted(output)))
+
+    runner = CliRunner()
+    args = ['--path=%s' % path for path in paths]
+    assert runner.invoke(_count, args).output == '0 1 2 3\n'
+    assert runner.invoke(_count, args).output == '0 1 2 3\n'
+    assert CALLS == [paths]
+
+    tmpdir.join('1.txt').write('x\n' * 5)
+    os.utime(paths[1], ns=(0, 0))
+    assert runner.invoke(_count, args).output == '0 5 2 3\n'
+    assert CALLS[-1] == [paths[1]]
+
+    # other arguments key a separate index
+    assert runner.invoke(_count, args + ['--scale=2']).output == '0 10 4 6\n'
+    assert CALLS[-1] == paths
+
+
+def test_incremental_sequences_and_hashing(tmpdir):
+    paths = []
+    for i in range(3):
+        path = tmpdir.join('%d.txt' % i)
+        path.write(str(i))
+        paths.append(str(path))
+
+    def read(paths):
+        CALLS.append(paths)
+        return [open(p).read() for p in paths]
+
+    f = incremental(read, 'paths', index_dir=str(tmpdir.join('index')),
+                    hash_contents=True)
+    assert f(paths) == ['0', '1', '2']
+    os.utime(paths[0], ns=(0, 0))
+    tmpdir.join('2.txt').write('two')
+    assert f(paths[::-1]) == ['two', '1', '0']
+    assert CALLS == [paths, [paths[2]]]
+
+    with pytest.raises(ValueError):
+        incremental(lambda paths: [], 'paths',
+                    index_dir=str(tmpdir.join('index')))(paths)
@@ -1,13 +1,16 @@
+import pytest
+
 from ..argspec import get_argspec
 from ..call import call, use_output
 
 
-def test_call():
+@pytest.mark.parametrize('fast', [False, True])
+def test_call(fast):
     def f(x, y):
         "f documentation"
         return 'x is {}'.format(x)
 
-    @call(f)
+    @call(f, fast=fast)
     def _f(): pass
 
     # check that _f has the docstring, name, and argspec of f
@@ -20,14 +23,15 @@ def test_call():
     assert actual == expected, "call redirected"
 
 
-def test_use_output():
+@pytest.mark.parametrize('fast', [False, True])
+def test_use_output(fast):
     def f(x, y):
         "f documentation"
         return x + y
 
     outputs = []
 
-    @use_output(f)
+    @use_output(f, fast=fast)
     def _f(output):
         outputs.append(output)
 
@@ -40,3 +44,88 @@ def test_use_output():
     actual = _f(1, 2)
     assert actual == expected, "call redirected"
     assert outputs == [expected, ], "output was sent to _f"
+
+
+@pytest.mark.parametrize('fast', [False, True])
+def test_use_output_stream(fast):
+    produced = []
+
+    def f(n):
+        for i in range(n):
+            produced.append(i)
+            yield i
+
+    chunks = []
+
+    @use_output(f, fast=fast, stream=True, buffer_size=2)
+    def _f(output):
+        # the printer sees each chunk before later items are produced
+        chunks.append((list(output), len(produced)))
+
+    assert _f(5) is None
+    assert chunks == [([0, 1], 2), ([2, 3], 4), ([4], 5)]
+
+    # non-iterator outputs are passed through whole
+    outputs = []
+
+    @use_output(lambda: [1, 2, 3], fast=fast, stream=True, buffer_size=2)
+    def _g(output):
+        outputs.append(output)
+
+    assert _g() == [1, 2, 3]
+    assert outputs == [[1, 2, 3]]
+
+
+def test_use_output_stream_flush_interval():
+
+    def f():
+        yield 1
+        yield 2
+
+    chunks = []
+
+    @use_output(f, stream=True, flush_interval=0)
+    def _f(output):
+        chunks.append(output)
+
+    _f()
+    assert chunks == [[1], [2]]
+
+
+@pytest.mark.parametrize('fast', [False, True])
+def test_call_coroutine_function(fast):
+    import asyncio
+
+    async def f(x, y=1):
+        "f documentation"
+        await asyncio.sleep(0)
+        return x + y
+
+    @call(f, fast=fast)
+    def _f(): pass
+
+    assert _f.__doc__ == "f documentation"
+    assert get_argspec(_f).args == ['x', 'y']
+    assert _f(1, y=2) == 3
+
+
+@pytest.mark.parametrize('fast', [False, True])
+def test_use_output_stream_async_generator(fast):
+    import asyncio
+    produced = []
+
+    async def f(n):
+        for i in range(n):
+            await asyncio.sleep(0)
+            produced.append(i)
+            yield i
+
+    chunks = []
+
+    @use_output(f, fast=fast, stream=True, buffer_size=2)
+    def _f(chunk):
+        # each chunk is printed as soon as it is full
+        chunks.append((list(chunk), len(produced)))
+
+    assert _f(5) is None
+    assert chunks == [([0, 1], 2), ([2, 3], 4), ([4], 5)]
@@ -0,0 +1,81 @@
+from __future__ import print_function
+
+import sys
+import textwrap
+
+import click
+from click.testing import CliRunner
+
+from ..command import command, lazy_group
+
+
+LAZY_MODULE = textwrap.dedent("""
+    import click
+
+    @click.command('do-something')
+    def _do_something():
+        click.echo('did something')
+""")
+
+
+def test_command_name_mangling():
+
+    @click.group()
+    def cli(): pass
+
+    @command(cli)
+    def _do_something():
+        click.echo('did something')
+
+    result = CliRunner().invoke(cli, ['do-something'])
+    assert result.exception is None
+    assert result.output.strip() == 'did something'
+
+
+def test_lazy_group(tmpdir, monkeypatch):
+    tmpdir.join('lazy_commands_mod.py').write(LAZY_MODULE)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    monkeypatch.delitem(sys.modules, 'lazy_commands_mod', raising=False)
+
+    @lazy_group(None, {
+        'lazy_commands_mod._do_something': 'a lazy command',
+        'lazy_commands_mod:_do_other_thing': 'another lazy command',
+    })
+    def _cli(): pass
+
+    runner = CliRunner()
+
+    # help is served from the declared table, without importing
+    result = runner.invoke(_cli, ['--help'])
+    assert result.exception is None
+    assert 'do-something' in result.output
+    assert 'a lazy command' in result.output
+    assert 'do-other-thing' in result.output
+    assert 'lazy_commands_mod' not in sys.modules
+
+    # invoking the command imports it
+    result = runner.invoke(_cli, ['do-something'])
+    assert result.exception is None
+    assert result.output.strip() == 'did something'
+    assert 'lazy_commands_mod' in sys.modules
+
+    # unknown attributes surface as errors when invoked
+    result = runner.invoke(_cli, ['do-other-thing'])
+    assert result.exception is not None
+
+
+def test_lazy_group_mixes_with_eager_commands():
+
+    @lazy_group(None, {})
+    def _cli(): pass
+
+    @command(_cli)
+    def _eager():
+        "an eager command"
+        click.echo('eager')
+
+    runner = CliRunner()
+    result = runner.invoke(_cli, ['--help'])
+    assert 'an eager command' in result.output
+    result = runner.invoke(_cli, ['eager'])
+    assert result.output.strip() == 'eager'
@@ -0,0 +1,125 @@
+from __future__ import print_function
+
+import os
+import time
+
+import click
+from click.shell_completion import ShellComplete
+
+from ..args import EXISTING_DIR, EXISTING_FILE, option
+from ..completion import cached_completion, scandir_candidates
+
+
+def make_tree(tmpdir):
+    tmpdir.join('alpha.txt').write('')
+    tmpdir.join('also.txt').write('')
+    tmpdir.join('.hidden').write('')
+    tmpdir.mkdir('adir').join('inner.txt').write('')
+    return str(tmpdir)
+
+
+def test_scandir_candidates(tmpdir):
+    root = make_tree(tmpdir)
+    prefix = os.path.join(root, 'a')
+    assert scandir_candidates(prefix) == [
+        os.path.join(root, 'adir') + os.sep,
+        os.path.join(root, 'alpha.txt'),
+        os.path.join(root, 'also.txt'),
+    ]
+    assert scandir_candidates(prefix, file_okay=False) == [
+        os.path.join(root, 'adir') + os.sep,
+    ]
+    assert scandir_candidates(os.path.join(root, '.')) == [
+        os.path.join(root, '.hidden'),
+    ]
+    assert scandir_candidates(os.path.join(root, 'adir', '')) == [
+        os.path.join(root, 'adir', 'inner.txt'),
+    ]
+    assert scandir_candidates(os.path.join(root, 'missing', 'x')) == []
+
+
+def completions(command, args, incomplete):
+    complete = ShellComplete(command, {}, 'f', '_F_COMPLETE')
+    return [item.value for item in complete.get_completions(args, incomplete)]
+
+
+def test_path_types_complete_with_scandir(tmpdir):
+    root = make_tree(tmpdir)
+
+    @click.command('f')
+    @option('--in-file', None, EXISTING_FILE, 'a file')
+    @option('--in-dir', None, EXISTING_DIR, 'a dir')
+    def f(in_file, in_dir): pass
+
+    prefix = os.path.join(root, 'al')
+    assert completions(f, ['--in-file'], prefix) == [
+        os.path.join(root, 'alpha.txt'),
+        os.path.join(root, 'also.txt'),
+    ]
+    assert completions(f, ['--in-dir'], prefix) == []
+
+
+def test_cached_completion(tmpdir):
+    calls = []
+    watched = tmpdir.join('hosts.conf')
+    watched.write('')
+
+    def list_hosts(ctx, param):
+        calls.append(param.name)
+        return ['web1', ('web2', 'the second web host'), 'db1']
+
+    complete_hosts = cached_completion(list_hosts, watch=[str(watched)],
+                                       cache_dir=str(tmpdir))
+
+    @click.command('f')
+    @option('--host', None, {'type': str, 'complete': complete_hosts},
+            'a host')
+    def f(host): pass
+
+    assert completions(f, ['--host'], 'web') == ['web1', 'web2']
+    assert completions(f, ['--host'], 'db') == ['db1']
+    assert calls == ['host']
+
+    # modifying a watched file invalidates the cache
+    mtime = os.path.getmtime(str(watched))
+    os.utime(str(watched), (mtime + 10, mtime + 10))
+    assert completions(f, ['--host'], '') == ['web1', 'web2', 'db1']
+    assert calls == ['host', 'host']
+
+    # so does the ttl
+    complete_hosts = cached_completion(list_hosts, ttl=0,
+                                       cache_dir=str(tmpdir))
+
+    @click.command('g')
+    @option('--host', None, {'type': str, 'complete': complete_hosts},
+            'a host')
+    def g(host): pass
+
+    completions(g, ['--host'], '')
+    time.sleep(0.01)
+    completions(g, ['--host'], '')
+    assert len(calls) == 4
+
+
+def test_unreadable_cache_is_a_miss(tmpdir):
+    calls = []
+
+    def list_hosts(ctx, param):
+        calls.append(param.name)
+        return ['web1']
+
+    @click.command('f')
+    @option('--host', None,
+            {'type': str,
+             'complete': cached_completion(list_hosts,
+                                           cache_dir=str(tmpdir))},
+            'a host')
+    def f(host): pass
+
+    assert completions(f, ['--host'], '') == ['web1']
+    [cache_file] = tmpdir.listdir()
+    for content in ['{"created": 0', '{"old": "format"}', '[1, 2]',
+                    '{"created": 1e20, "mtimes": {}, "candidates": [1]}']:
+        cache_file.write(content)
+        assert completions(f, ['--host'], '') == ['web1']
+    assert len(calls) == 5
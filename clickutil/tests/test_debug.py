@@ -1,10 +1,16 @@
 from __future__ import print_function
 
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
 import click
 from click.testing import CliRunner
 
 from ..argspec import get_argspec
-from ..debug import debug
+from ..debug import crash_dump, debug
 
 
 class MockDebugger(object):
@@ -99,3 +105,97 @@ def test_debug_called_by_default():
 
     runner.invoke(f)
     assert mock_debugger.called
+
+
+def test_debug_stacks_with_options():
+
+    mock_debugger = MockDebugger()
+    runner = CliRunner()
+
+    @click.command('f')
+    @debug(False, delay=0, use_debugger=mock_debugger)
+    @click.option('--x', default=3)
+    def f(x):
+        click.echo('x = %s' % x)
+
+    assert sorted(p.name for p in f.params) == ['debug', 'x']
+    result = runner.invoke(f, ['--debug', '--x', '4'])
+    assert result.output.strip() == 'x = 4'
+
+
+CRASHING_SCRIPT = textwrap.dedent("""
+    import threading
+    import click
+    import clickutil
+
+    def f(x):
+        secret = 'y' * 1000
+        raise ValueError('bad x: %s' % x)
+
+    @click.command('f')
+    @clickutil.crash_dump()
+    @clickutil.option('--x', None, int, 'a number')
+    @clickutil.call(f)
+    def _f(): pass
+
+    # a hung non-daemon thread must not stop us exiting
+    threading.Thread(target=threading.Event().wait).start()
+    _f()
+""")
+
+
+def test_crash_dump_adds_no_wrapper():
+
+    def f(x=3):
+        return x
+
+    assert crash_dump()(f) is f
+
+
+def test_crash_dump_writes_report(tmpdir):
+    script = tmpdir.join('script.py')
+    script.write(CRASHING_SCRIPT)
+    report_path = str(tmpdir.join('crash.json'))
+    process = subprocess.Popen(
+        [sys.executable, str(script), '--x', '7', '--crash-dump', report_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = process.communicate(timeout=30)
+    assert process.returncode == 1
+    assert b'ValueError: bad x: 7' in err
+    assert b'crash report written to' in err
+
+    with open(report_path) as f:
+        report = json.load(f)
+    assert report['argv'][1:] == ['--x', '7', '--crash-dump', report_path]
+    assert report['exception'] == {'type': 'ValueError', 'message': 'bad x: 7'}
+    frame = report['frames'][-1]
+    assert frame['function'] == 'f'
+    assert frame['code'] == "raise ValueError('bad x: %s' % x)"
+    assert frame['locals']['x'] == '7'
+    assert len(frame['locals']['secret']) == 200
+
+
+def test_crash_dump_to_directory_via_envvar(tmpdir):
+    script = tmpdir.join('script.py')
+    script.write(CRASHING_SCRIPT)
+    dump_dir = tmpdir.mkdir('dumps')
+    env = dict(os.environ, CLICKUTIL_CRASH_DUMP=str(dump_dir))
+    status = subprocess.call([sys.executable, str(script), '--x', '1'],
+                             env=env, stderr=subprocess.DEVNULL, timeout=30)
+    assert status == 1
+    assert len(dump_dir.listdir()) == 1
+
+
+def test_crash_dump_reinstalls_in_place(tmpdir):
+    script = tmpdir.join('script.py')
+    script.write(CRASHING_SCRIPT.replace(
+        '\n_f()', '\nclickutil.install_crash_dump(%r)\n_f()'
+        % str(tmpdir.join('old.json'))))
+    report_path = str(tmpdir.join('new.json'))
+    status = subprocess.call(
+        [sys.executable, str(script), '--x', '1', '--crash-dump',
+         report_path], stderr=subprocess.DEVNULL, timeout=30)
+    assert status == 1
+    # the second install replaced the first path, rather than chaining
+    assert os.path.exists(report_path)
+    assert not tmpdir.join('old.json').exists()
@@ -0,0 +1,223 @@
+from __future__ import print_function
+
+import gzip
+import mmap
+import os
+import pickle
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from ..args import EXISTING_FILE, option
+from ..call import use_output
+from ..files import (INPUT_STREAM, MAPPED_FILE, InputStream, close_view,
+                     line_ranges, map_file, map_lines, open_input)
+from ..parallel import jobs
+
+
+def make_command(views):
+
+    def find_world(data):
+        views.append((data, data.obj))
+        return data.obj.find(b'world'), bytes(data[:5])
+
+    @click.command('find')
+    @option('--data', None, MAPPED_FILE, 'the data')
+    @use_output(find_world)
+    def _find(output):
+        click.echo('%d %r' % output)
+
+    return _find
+
+
+def test_mapped_file(tmpdir):
+    path = tmpdir.join('data.bin')
+    path.write_binary(b'hello\nworld\n' * 1000)
+    views = []
+    result = CliRunner().invoke(make_command(views), ['--data', str(path)])
+    assert result.exit_code == 0, result.output
+    assert result.output == "6 b'hello'\n"
+    # the mapping is closed along with the click context
+    view, mapping = views[0]
+    assert isinstance(mapping, mmap.mmap) and mapping.closed
+    with pytest.raises(ValueError):
+        view[0]
+
+
+def test_mapped_file_from_stdin():
+    views = []
+    result = CliRunner().invoke(make_command(views), ['--data', '-'],
+                                input=b'hello world')
+    assert result.exit_code == 0, result.output
+    assert result.output == "6 b'hello'\n"
+
+
+def test_mapped_file_errors(tmpdir):
+    result = CliRunner().invoke(make_command([]),
+                                ['--data', str(tmpdir.join('missing'))])
+    assert result.exit_code == 2
+    assert 'does not exist' in result.output
+
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='needs FIFOs')
+def test_map_file_falls_back_to_reading(tmpdir):
+    empty = tmpdir.join('empty')
+    empty.write_binary(b'')
+    assert map_file(str(empty)).tobytes() == b''
+
+    fifo = str(tmpdir.join('fifo'))
+    os.mkfifo(fifo)
+    if os.fork() == 0:
+        with open(fifo, 'wb') as f:
+            f.write(b'piped')
+        os._exit(0)
+    view = map_file(fifo)
+    os.wait()
+    assert isinstance(view.obj, bytes) and view.tobytes() == b'piped'
+    close_view(view)
+
+
+def test_close_view_with_live_slices(tmpdir):
+    path = tmpdir.join('data.bin')
+    path.write_binary(b'0123456789')
+    view = map_file(str(path))
+    piece = view[2:4]
+    close_view(view)
+    assert piece.tobytes() == b'23'
+
+    view = map_file(str(path))
+    exported = pickle.PickleBuffer(view)
+    close_view(view)
+    assert exported.raw().tobytes() == b'0123456789'
+
+
+def make_stream_command(param_type):
+
+    def count(source):
+        counts = [len(item) for item in source]
+        return len(counts), sum(counts)
+
+    @click.command('count')
+    @option('--source', None, param_type, 'the input')
+    @use_output(count)
+    def _count(output):
+        click.echo('%d items, %d bytes' % output)
+
+    return _count
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip', 'bz2', 'lzma'])
+def test_input_stream(tmpdir, compression):
+    data = b'line\n' * 1000
+    path = tmpdir.join('data')
+    if compression is None:
+        path.write_binary(data)
+    else:
+        module = __import__(compression)
+        with module.open(str(path), 'wb') as f:
+            f.write(data)
+    command = make_stream_command(INPUT_STREAM)
+    result = CliRunner().invoke(command, ['--source', str(path)])
+    assert result.exit_code == 0, result.output
+    assert result.output == '1000 items, 5000 bytes\n'
+
+    command = make_stream_command(InputStream(lines=False, buffer_size=1024))
+    result = CliRunner().invoke(command, ['--source', str(path)])
+    assert result.output == '5 items, 5000 bytes\n'
+
+
+def test_input_stream_from_stdin():
+    data = gzip.compress('héllo\nwörld\n'.encode('utf-8'))
+    command = make_stream_command(INPUT_STREAM)
+    result = CliRunner().invoke(command, ['--source', '-'], input=data)
+    assert result.exit_code == 0, result.output
+    assert result.output == '2 items, 12 bytes\n'
+
+
+class Trickle(object):
+    "A stand-in for a pipe which returns one byte per read."
+
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, size=-1):
+        data, self.data = self.data[:1], self.data[1:]
+        return data
+
+
+def test_open_input_from_a_slow_pipe(monkeypatch):
+    monkeypatch.setattr('sys.stdin', Trickle(gzip.compress(b'a\nb\n')))
+    with open_input('-', encoding='ascii') as stream:
+        assert stream.readlines() == ['a\n', 'b\n']
+
+    monkeypatch.setattr('sys.stdin', Trickle(b'\x1f'))
+    with open_input('-') as stream:
+        assert stream.read() == b'\x1f'
+
+
+def test_open_input_closes_everything(tmpdir):
+    path = tmpdir.join('data.gz')
+    path.write_binary(gzip.compress(b'abc'))
+    stream = open_input(str(path))
+    assert stream.read() == b'abc'
+    stream.close()
+    assert stream._source.closed
+
+    # text that happens to start like a bz2 header is left alone
+    path.write_binary(b'BZh is not compressed')
+    with open_input(str(path), encoding='ascii') as stream:
+        assert stream.read() == 'BZh is not compressed'
+
+
+def test_line_ranges(tmpdir):
+    path = tmpdir.join('data.txt')
+    lines = ['%d\n' % (10 ** (i % 5)) for i in range(100)]
+    path.write(''.join(lines))
+    data = path.read_binary()
+    for count in [1, 3, 7, 100, 1000]:
+        ranges = line_ranges(str(path), count)
+        assert len(ranges) <= count
+        assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            assert end == start and data[end - 1:end] == b'\n'
+
+    path.write('no trailing newline\nat the end')
+    assert line_ranges(str(path), 2) == [(0, 20), (20, 30)]
+    path.write('')
+    assert line_ranges(str(path), 4) == []
+
+
+@pytest.mark.parametrize('jobs', [None, 1, 3])
+def test_map_lines(tmpdir, jobs):
+    path = tmpdir.join('data.txt')
+    path.write(''.join('%d\n' % i for i in range(1000)))
+    results = map_lines(lambda line: (os.getpid(), int(line)), str(path),
+                        jobs=jobs, range_bytes=100)
+    pids, numbers = zip(*results)
+    assert list(numbers) == list(range(1000))
+    if jobs == 3:
+        assert os.getpid() not in pids
+    assert list(map_lines(len, str(path), jobs=jobs,
+                          encoding=None))[:2] == [2, 2]
+
+
+def test_map_lines_uses_jobs_option(tmpdir):
+    path = tmpdir.join('data.txt')
+    path.write('a\nb\nc\n')
+
+    def upper(line):
+        return os.getpid(), line.upper()
+
+    @click.command('upper')
+    @jobs(executor='thread')
+    @option('--path', None, EXISTING_FILE, 'the input')
+    @use_output(lambda path: map_lines(upper, path), stream=True)
+    def _upper(lines):
+        pids, lines = zip(*lines)
+        assert set(pids) == {os.getpid()}
+        click.echo(''.join(lines), nl=False)
+
+    result = CliRunner().invoke(_upper, ['--path', str(path), '-j', '2'])
+    assert result.exit_code == 0, result.output
+    assert result.output == 'A\nB\nC\n'
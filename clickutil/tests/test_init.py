@@ -0,0 +1,71 @@
+from __future__ import print_function
+
+import json
+import subprocess
+import sys
+
+import clickutil
+
+
+# generous, since the lazy package itself takes around a millisecond
+IMPORT_BUDGET_SECONDS = 0.05
+
+HEAVY_MODULES = ['click', 'tdx', 'wrapt', 'asyncio', 'multiprocessing',
+                 'concurrent.futures', 'socket', 'cProfile', 'tracemalloc']
+
+
+def loaded_modules(code):
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        code + '; import json, sys; print(json.dumps(sorted(sys.modules)))'
+    ])
+    return set(json.loads(output.decode('utf-8').splitlines()[-1]))
+
+
+def import_time(module):
+    "The cumulative time to import `module` in a fresh interpreter."
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        stderr=subprocess.STDOUT).decode('utf-8')
+    for line in output.splitlines():
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1e6
+    raise AssertionError('no import time for %s in:\n%s' % (module, output))
+
+
+def test_import_is_lazy():
+    modules = loaded_modules('import clickutil')
+    assert modules.isdisjoint(HEAVY_MODULES), modules & set(HEAVY_MODULES)
+
+
+def test_import_time_budget():
+    best = min(import_time('clickutil') for _ in range(3))
+    assert best < IMPORT_BUDGET_SECONDS
+
+
+def test_debug_imports_tdx_only_when_debugging():
+    run = ('import clickutil; '
+           'clickutil.debug()(lambda x: x)(debug=%s, x=1)')
+    assert 'tdx' not in loaded_modules(run % False)
+    assert 'tdx' in loaded_modules(run % True)
+
+
+def test_names_win_over_submodules():
+    import clickutil.debug  # noqa: F401
+    from clickutil import call, timing
+    assert callable(clickutil.debug)
+    assert callable(call)
+    assert timing.timings is clickutil.timings
+    assert clickutil.option.__module__ == 'clickutil.args'
+
+
+def test_exports():
+    # the argspec helpers, for using `option` and `boolean` without `call`
+    for name in ['with_argspec', 'wraps', 'get_argspec', 'mk_decorator']:
+        assert name in clickutil.__all__
+        assert callable(getattr(clickutil, name))
+    # timing internals stay in their module
+    for name in ['current', 'last', 'timed', 'record_import']:
+        assert name not in clickutil.__all__
+        assert callable(getattr(clickutil.timing, name))
@@ -0,0 +1,149 @@
+from __future__ import print_function
+
+import os
+import sys
+import textwrap
+
+import pytest
+from click.testing import CliRunner
+
+from ..command import lazy_group
+from ..manifest import ManifestCommand, write_manifest
+
+
+MANIFEST_MODULE = textwrap.dedent("""
+    import os
+
+    import click
+    import clickutil
+
+    def build(target, mode='fast', verbose=False, tags=(), host=None):
+        click.echo('%s %s %s %s' % (target, mode, verbose, list(tags)))
+
+    def list_hosts(ctx, param):
+        return ['h1', 'h2']
+
+    @click.command('build')
+    @clickutil.option('--target', '-t', clickutil.EXISTING_FILE,
+                      'file to build')
+    @clickutil.option('--mode', None, click.Choice(['fast', 'slow']),
+                      'how to build')
+    @clickutil.boolean('--verbose', 'print more')
+    @clickutil.option('--tags', None,
+                      {'multiple': True, 'type': str,
+                       'complete': lambda ctx, param, incomplete: ['t1']},
+                      'tags to apply')
+    @clickutil.option('--host', None,
+                      {'type': str,
+                       'complete': clickutil.cached_completion(
+                           list_hosts,
+                           cache_dir=os.path.join(os.path.dirname(__file__),
+                                                  'completion-cache'))},
+                      'host to build on')
+    @clickutil.call(build)
+    def _build():
+        "Build the target."
+""")
+
+MODULE_NAME = 'manifest_commands_mod'
+
+
+@pytest.fixture
+def make_cli(tmpdir, monkeypatch):
+    tmpdir.join(MODULE_NAME + '.py').write(MANIFEST_MODULE)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    manifest_path = str(tmpdir.join('manifest.json'))
+
+    def make_cli(manifest=manifest_path):
+        sys.modules.pop(MODULE_NAME, None)
+
+        @lazy_group(None, {MODULE_NAME + '._build': 'build things'},
+                    manifest=manifest)
+        def _cli(): pass
+
+        return _cli
+
+    write_manifest(make_cli(None), manifest_path)
+    sys.modules.pop(MODULE_NAME, None)
+    yield make_cli
+    sys.modules.pop(MODULE_NAME, None)
+
+
+def test_help_from_manifest(make_cli):
+    runner = CliRunner()
+    expected = runner.invoke(make_cli(None), ['build', '--help']).output
+    assert MODULE_NAME in sys.modules
+
+    cli = make_cli()
+    assert isinstance(cli.get_command(None, 'build'), ManifestCommand)
+    result = runner.invoke(cli, ['build', '--help'])
+    assert result.exception is None
+    assert MODULE_NAME not in sys.modules
+    assert result.output == expected
+    assert '[multiple]' in result.output
+
+
+def test_invoke_with_manifest(make_cli, tmpdir):
+    target = str(tmpdir.join(MODULE_NAME + '.py'))
+    result = CliRunner().invoke(
+        make_cli(), ['build', '-t', target, '--verbose', '--tags', 'a'])
+    assert result.exception is None
+    assert result.output.strip() == '%s fast True [\'a\']' % target
+    assert MODULE_NAME in sys.modules
+
+    # `--help` as the value of an option isn't a request for help
+    result = CliRunner().invoke(
+        make_cli(), ['build', '-t', target, '--tags', '--help'])
+    assert result.exception is None
+    assert result.output.strip() == "%s fast False ['--help']" % target
+
+    # validation still happens in the real command
+    result = CliRunner().invoke(make_cli(), ['build', '-t', 'missing'])
+    assert result.exit_code == 2
+
+
+def test_completion_from_manifest(make_cli, tmpdir):
+    from click.shell_completion import ShellComplete
+    complete = ShellComplete(make_cli(), {}, 'cli', '_CLI_COMPLETE')
+
+    items = complete.get_completions(['build', '--mode'], '')
+    assert [item.value for item in items] == ['fast', 'slow']
+    items = complete.get_completions(['build'], '--ver')
+    assert [item.value for item in items] == ['--verbose']
+    # paths complete with os.scandir, as in the real command
+    items = complete.get_completions(['build', '-t'],
+                                     str(tmpdir.join('manifest.')))
+    assert [item.value for item in items] == [str(tmpdir.join(
+        'manifest.json'))]
+    assert MODULE_NAME not in sys.modules
+
+    # completion callbacks need the real command
+    items = complete.get_completions(['build', '--tags'], '')
+    assert [item.value for item in items] == ['t1']
+    assert MODULE_NAME in sys.modules
+
+
+def test_cached_completion_from_manifest(make_cli):
+    from click.shell_completion import ShellComplete
+    for _ in range(2):
+        complete = ShellComplete(make_cli(), {}, 'cli', '_CLI_COMPLETE')
+        items = complete.get_completions(['build', '--host'], '')
+        assert [item.value for item in items] == ['h1', 'h2']
+    # the second time, the candidates came from the cache
+    assert MODULE_NAME not in sys.modules
+
+
+def test_stale_manifest_is_ignored(make_cli, tmpdir):
+    path = str(tmpdir.join(MODULE_NAME + '.py'))
+    mtime = os.path.getmtime(path)
+    os.utime(path, (mtime + 10, mtime + 10))
+    cli = make_cli()
+    assert not isinstance(cli.get_command(None, 'build'), ManifestCommand)
+    assert MODULE_NAME in sys.modules
+
+
+def test_missing_manifest_is_ignored(make_cli, tmpdir):
+    cli = make_cli(str(tmpdir.join('missing.json')))
+    result = CliRunner().invoke(cli, ['build', '--help'])
+    assert result.exception is None
+    assert MODULE_NAME in sys.modules
@@ -0,0 +1,234 @@
+from __future__ import print_function
+
+import os
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from ..args import option
+from ..batch import batch
+from ..call import call, use_output
+from ..parallel import MapError, jobs, map_option, run_parallel
+
+
+def square(x):
+    return x * x
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread'])
+def test_run_parallel(executor):
+    actual = list(run_parallel(square, range(20), 3, executor=executor))
+    assert actual == [x * x for x in range(20)]
+
+    actual = list(run_parallel(square, range(20), 3, executor=executor,
+                               ordered=False))
+    assert sorted(actual) == [x * x for x in range(20)]
+
+
+def test_run_parallel_uses_processes():
+    pids = set(run_parallel(lambda _: os.getpid(), range(8), 2))
+    assert os.getpid() not in pids
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread'])
+def test_run_parallel_propagates_errors(executor):
+
+    def f(x):
+        if x == 3:
+            raise ValueError('bad item')
+        return x
+
+    with pytest.raises(ValueError):
+        list(run_parallel(f, range(10), 2, executor=executor))
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread'])
+def test_run_parallel_captures_output(executor):
+
+    def f(x):
+        click.echo('out %d' % x)
+        click.echo('err %d' % x, err=True)
+        return x
+
+    actual = list(run_parallel(f, range(5), 2, executor=executor,
+                               capture_output=True))
+    expected = [(x, 'out %d\n' % x, 'err %d\n' % x) for x in range(5)]
+    assert actual == expected
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread'])
+def test_run_parallel_captures_binary_output(executor):
+
+    def f(x):
+        click.echo('text %d' % x)
+        click.echo(b'bytes %d' % x)
+        if x == 1:
+            click.echo(b'\xff')
+        return x
+
+    actual = list(run_parallel(f, range(2), 2, executor=executor,
+                               capture_output=True))
+    assert actual == [(0, 'text 0\nbytes 0\n', ''),
+                      (1, b'text 1\nbytes 1\n\xff\n', '')]
+
+
+def test_run_parallel_rejects_unknown_executor():
+    with pytest.raises(ValueError):
+        list(run_parallel(square, range(3), 2, executor='gpu'))
+    with pytest.raises(ValueError):
+        jobs(executor='gpu')
+
+
+def make_command(executor):
+
+    def f(x):
+        if x < 0:
+            raise ValueError('negative')
+        return x * x
+
+    @click.command('f')
+    @batch()
+    @jobs(executor=executor)
+    @option('--x', None, int, 'a number')
+    @use_output(f)
+    def _f(output):
+        click.echo('%s (pid %s)' % (output, os.getpid()))
+
+    return _f
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread'])
+def test_parallel_batch(executor):
+    lines = '\n'.join('--x %d' % x for x in range(10))
+    result = CliRunner().invoke(make_command(executor),
+                                ['--batch', '-', '--jobs', '3'], input=lines)
+    assert result.exit_code == 0
+    outputs = [line.split() for line in result.output.splitlines()
+               if not line.startswith('[batch]')]
+    assert [output[0] for output in outputs] == [str(x * x)
+                                                 for x in range(10)]
+    # the printer runs in this process
+    assert set(output[2] for output in outputs) == {'%d)' % os.getpid()}
+
+
+def test_parallel_batch_checks_jobs():
+    for jobs_value in ['abc', '0']:
+        result = CliRunner().invoke(make_command('thread'),
+                                    ['--batch', '-', '--jobs', jobs_value],
+                                    input='--x 1')
+        assert result.exit_code == 2
+        assert "Invalid value for '--jobs'" in result.output
+
+
+def test_parallel_batch_stops_on_failure():
+    lines = '\n'.join(['--x 1', '--x -1'] + ['--x 2'] * 50)
+    result = CliRunner().invoke(make_command('thread'),
+                                ['-j', '2', '--batch', '-'], input=lines)
+    assert result.exit_code == 1
+    assert '[batch] line 2: exit status 1' in result.output
+    assert 'ValueError: negative' in result.output
+    assert result.output.count('exit status 0') < 51
+
+
+def make_map_command(executor, ordered=True):
+
+    def f(x, scale=1):
+        if x < 0:
+            raise ValueError('negative')
+        return scale * x * x
+
+    @click.command('f')
+    @jobs(executor=executor, ordered=ordered)
+    @map_option('--x', None, int, 'numbers')
+    @option('--scale', None, int, 'a multiplier')
+    @use_output(f)
+    def _f(output):
+        click.echo(output)
+
+    return _f
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread'])
+@pytest.mark.parametrize('n_jobs', ['1', '3'])
+def test_map_option(executor, n_jobs):
+    args = ['--x=%d' % x for x in range(10)] + ['--scale', '2', '-j', n_jobs]
+    result = CliRunner().invoke(make_map_command(executor), args)
+    assert result.exit_code == 0, result.output
+    assert result.output.split() == [str(2 * x * x) for x in range(10)]
+
+
+def test_map_option_unordered():
+    args = ['--x=%d' % x for x in range(10)] + ['-j', '3']
+    result = CliRunner().invoke(make_map_command('thread', ordered=False),
+                                args)
+    assert result.exit_code == 0, result.output
+    assert sorted(map(int, result.output.split())) == [x * x
+                                                       for x in range(10)]
+
+
+@pytest.mark.parametrize('n_jobs', ['1', '2'])
+def test_map_option_aggregates_errors(n_jobs):
+    args = ['--x=1', '--x=-1', '--x=2', '--x=-2', '-j', n_jobs]
+    result = CliRunner().invoke(make_map_command('process'), args)
+    assert result.exit_code == 1
+    assert result.output.count('Traceback') == 2
+    assert 'Error: 2 of 4 values of --x failed:' in result.output
+    assert '  -1: ValueError: negative' in result.output
+    lines = result.output.splitlines()
+    assert '1' in lines and '4' in lines
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread'])
+def test_map_option_prints_in_this_process(executor):
+    printed = []
+
+    @click.command('f')
+    @jobs(executor=executor)
+    @map_option('--x', None, int, 'numbers')
+    @use_output(square)
+    def _f(output):
+        printed.append((output, os.getpid()))
+        click.echo(b'%d' % output)
+
+    args = ['--x=%d' % x for x in range(6)] + ['-j', '3']
+    result = CliRunner().invoke(_f, args)
+    assert result.exit_code == 0, result.output
+    assert result.output.split() == [str(x * x) for x in range(6)]
+    assert printed == [(x * x, os.getpid()) for x in range(6)]
+
+
+def test_map_option_reports_printer_errors():
+
+    @click.command('f')
+    @jobs()
+    @map_option('--x', None, int, 'numbers')
+    @use_output(square)
+    def _f(output):
+        if output == 4:
+            raise ValueError('cannot print')
+        click.echo(output)
+
+    result = CliRunner().invoke(_f, ['--x=1', '--x=2', '--x=3', '-j', '2'])
+    assert result.exit_code == 1
+    lines = result.output.splitlines()
+    assert '1' in lines and '9' in lines
+    assert '  2: ValueError: cannot print' in lines
+
+
+def test_map_option_returns_results():
+
+    def f(x=3):
+        return x + 1
+
+    @map_option('--x', None, int, 'numbers')
+    @call(f)
+    def _f(): pass
+
+    assert _f(x=(1, 2)) == [2, 3]
+    # without values, call the target once with its default
+    assert _f(x=()) == [4]
+    with pytest.raises(MapError) as info:
+        _f(x=(1, 'a'))
+    assert info.value.results == [2, None]
+    assert info.value.failures[0][0] == 'a'
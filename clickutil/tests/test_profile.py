@@ -0,0 +1,158 @@
+from __future__ import print_function
+
+import json
+import pstats
+import signal
+import time
+import tracemalloc
+
+import click
+from click.testing import CliRunner
+
+from ..argspec import get_argspec
+from ..profile import memprofile, profile, sample_profile
+
+
+def busy_function():
+    return sum(range(1000))
+
+
+def make_command(default=False):
+
+    @click.command('f')
+    @profile(default)
+    @click.option('--x', default=3)
+    def f(x):
+        busy_function()
+        click.echo('x = %s' % x)
+
+    return f
+
+
+def test_profile_preserves_metadata():
+
+    @profile()
+    def f(x=3):
+        "f documentation"
+        pass
+
+    assert f.__doc__ == "f documentation"
+    assert 'x' in get_argspec(f).args
+
+
+def test_profile_off_by_default():
+    result = CliRunner().invoke(make_command(), ['--x', '4'])
+    assert result.exception is None
+    assert result.output.strip() == 'x = 4'
+
+
+def test_profile_prints_summary():
+    result = CliRunner().invoke(make_command(), ['--profile'])
+    assert result.exception is None
+    assert result.output.startswith('x = 3')
+    assert 'busy_function' in result.output
+
+    result = CliRunner().invoke(make_command(True), [])
+    assert 'busy_function' in result.output
+
+    result = CliRunner().invoke(make_command(True), ['--no-profile'])
+    assert result.output.strip() == 'x = 3'
+
+
+def test_profile_output(tmpdir):
+    path = str(tmpdir.join('f.prof'))
+    result = CliRunner().invoke(make_command(), ['--profile-output', path])
+    assert result.exception is None
+    stats = pstats.Stats(path)
+    assert any(func[2] == 'busy_function' for func in stats.stats)
+
+
+def spin(seconds):
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+
+
+def make_sampled_command():
+
+    @click.command('f')
+    @sample_profile(default_hz=1000)
+    @click.option('--x', default=3)
+    def f(x):
+        spin(0.2)
+        click.echo('x = %s' % x)
+
+    return f
+
+
+def test_sample_profile_off_by_default():
+    result = CliRunner().invoke(make_sampled_command(), ['--x', '4'])
+    assert result.exception is None
+    assert result.output.strip() == 'x = 4'
+
+
+def test_sample_profile(tmpdir):
+    path = str(tmpdir.join('f.collapsed'))
+    result = CliRunner().invoke(
+        make_sampled_command(),
+        ['--sample-profile', '--sample-profile-output', path]
+    )
+    assert result.exception is None
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(' ', 1)
+        assert int(count) > 0
+    assert any('spin (test_profile.py' in line for line in lines)
+    assert signal.getsignal(signal.SIGPROF) == signal.SIG_DFL
+
+
+def test_sample_profile_to_stderr():
+    result = CliRunner().invoke(make_sampled_command(),
+                                ['--sample-profile=500'])
+    assert result.exception is None
+    assert 'spin (test_profile.py' in result.output
+
+
+KEEP_ALIVE = []
+
+
+def allocate():
+    KEEP_ALIVE.append([str(i) * 10 for i in range(20000)])
+
+
+def make_memprofiled_command():
+
+    @click.command('f')
+    @memprofile(limit=5)
+    @click.option('--x', default=3)
+    def f(x):
+        allocate()
+        click.echo('x = %s' % x)
+
+    return f
+
+
+def test_memprofile_off_by_default():
+    result = CliRunner().invoke(make_memprofiled_command(), ['--x', '4'])
+    assert result.exception is None
+    assert result.output.strip() == 'x = 4'
+
+
+def test_memprofile(tmpdir):
+    path = str(tmpdir.join('mem.json'))
+    result = CliRunner().invoke(make_memprofiled_command(),
+                                ['--memprofile-output', path])
+    assert result.exception is None
+    assert 'peak RSS' in result.output
+    assert 'test_profile.py' in result.output
+    assert not tracemalloc.is_tracing()
+
+    with open(path) as f:
+        report = json.load(f)
+    assert report['traced_peak_bytes'] > 0
+    assert len(report['top']) <= 5
+    top = report['top'][0]
+    assert top['file'].endswith('test_profile.py')
+    assert top['size_diff_bytes'] > 100000
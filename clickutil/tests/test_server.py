@@ -0,0 +1,159 @@
+from __future__ import print_function
+
+import gc
+import multiprocessing
+import os
+import signal
+import time
+
+import click
+import pytest
+
+from ..server import connect, serve, zygote
+
+
+@click.group('cli')
+def _cli(): pass
+
+
+@_cli.command('echo')
+@click.argument('words', nargs=-1)
+def _echo(words):
+    click.echo(' '.join(words))
+    click.echo('stderr', err=True)
+
+
+@_cli.command('env')
+def _env():
+    click.echo('%s %s' % (os.getcwd(), os.environ.get('SERVER_TEST_VAR')))
+
+
+@_cli.command('record')
+@click.argument('path')
+@click.argument('word')
+def _record(path, word):
+    with open(path, 'a') as f:
+        f.write('%s %s %s %s\n' % (word, gc.isenabled(),
+                                    gc.get_freeze_count() > 0, os.getpid()))
+
+
+@_cli.command('fail')
+def _fail():
+    raise click.ClickException('failed')
+
+
+@pytest.fixture
+def server(tmpdir):
+    socket_path = str(tmpdir.join('cli.sock'))
+    process = multiprocessing.get_context('fork').Process(
+        target=serve, args=(_cli, socket_path))
+    process.start()
+    for _ in range(100):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.02)
+    yield socket_path
+    os.kill(process.pid, signal.SIGINT)
+    process.join(5)
+    assert not os.path.exists(socket_path)
+
+
+def run(socket_path, tmpdir, args):
+    paths = [str(tmpdir.join(name)) for name in ['in', 'out', 'err']]
+    with open(paths[0], 'w'):
+        pass
+    with open(paths[0]) as stdin, open(paths[1], 'w') as stdout, \
+            open(paths[2], 'w') as stderr:
+        status = connect(socket_path, args, stdin, stdout, stderr)
+    with open(paths[1]) as stdout, open(paths[2]) as stderr:
+        return status, stdout.read(), stderr.read()
+
+
+def test_server_runs_commands(server, tmpdir):
+    status, out, err = run(server, tmpdir, ['echo', 'hello', 'world'])
+    assert status == 0
+    assert out == 'hello world\n'
+    assert err == 'stderr\n'
+
+    status, out, err = run(server, tmpdir, ['fail'])
+    assert status == 1
+    assert 'failed' in err
+
+    status, out, err = run(server, tmpdir, ['nonsense'])
+    assert status == 2
+    assert 'Usage: cli' in err
+
+
+def test_server_forwards_cwd_and_env(server, tmpdir, monkeypatch):
+    monkeypatch.setenv('SERVER_TEST_VAR', 'from-client')
+    monkeypatch.chdir(str(tmpdir))
+    status, out, err = run(server, tmpdir, ['env'])
+    assert status == 0
+    assert out.strip() == '%s from-client' % os.getcwd()
+
+
+def test_connect_without_server(tmpdir):
+    with pytest.raises(OSError):
+        connect(str(tmpdir.join('missing.sock')), ['echo'])
+
+
+def run_zygote(queue_path, status_path, **kwargs):
+    status = zygote(_cli, queue_path, preload=['json'], **kwargs)
+    with open(status_path, 'w') as f:
+        f.write(str(status))
+
+
+def read_records(path):
+    with open(path) as f:
+        return sorted(line.split() for line in f)
+
+
+def test_zygote(tmpdir):
+    out_path = str(tmpdir.join('out'))
+    status_path = str(tmpdir.join('status'))
+    queue_path = str(tmpdir.join('queue'))
+    with open(queue_path, 'w') as f:
+        f.write('\n'.join([
+            'record %s a' % out_path,
+            '# a comment',
+            '["not", "an", "object"]',
+            'record %s b' % out_path,
+            'fail',
+        ]))
+    process = multiprocessing.get_context('fork').Process(
+        target=run_zygote, args=(queue_path, status_path),
+        kwargs={'max_children': 2})
+    process.start()
+    process.join(10)
+    with open(status_path) as f:
+        assert f.read() == '1'
+
+    records = read_records(out_path)
+    assert [r[0] for r in records] == ['a', 'b']
+    # children run with gc disabled and inherit frozen objects
+    assert all(r[1:3] == ['False', 'True'] for r in records)
+    assert records[0][3] != records[1][3]
+    assert str(process.pid) not in [r[3] for r in records]
+
+
+def test_zygote_reads_fifo(tmpdir):
+    out_path = str(tmpdir.join('out'))
+    status_path = str(tmpdir.join('status'))
+    queue_path = str(tmpdir.join('queue'))
+    os.mkfifo(queue_path)
+    process = multiprocessing.get_context('fork').Process(
+        target=run_zygote, args=(queue_path, status_path))
+    process.start()
+    # each writer closing the FIFO should not stop the zygote
+    for word in ['a', 'b']:
+        with open(queue_path, 'w') as f:
+            f.write('record %s %s\n' % (out_path, word))
+    for _ in range(100):
+        if os.path.exists(out_path) and len(read_records(out_path)) == 2:
+            break
+        time.sleep(0.02)
+    assert [r[0] for r in read_records(out_path)] == ['a', 'b']
+    os.kill(process.pid, signal.SIGINT)
+    process.join(5)
+    with open(status_path) as f:
+        assert f.read() == '0'
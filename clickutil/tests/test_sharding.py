@@ -0,0 +1,152 @@
+from __future__ import print_function
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from ..args import option
+from ..call import use_output
+from ..files import INPUT_STREAM, InputStream
+from ..sharding import in_shard, shard_of, sharded
+
+
+def test_shards_partition_items():
+    items = ['item-%d' % i for i in range(1000)] + list(range(100))
+    shards = [list(in_shard(items, index, 4)) for index in range(4)]
+    assert sorted(map(str, sum(shards, []))) == sorted(map(str, items))
+    assert all(150 < len(shard) < 400 for shard in shards)
+    # stable across runs and machines
+    assert [shard_of(x, 10) for x in ['a', b'a', 1, ('a', 1)]] == [7, 7, 3, 1]
+
+
+@pytest.mark.parametrize('item', [frozenset('abcd'), {'a': 1}, object(),
+                                  ('a', object())])
+def test_shard_of_rejects_unstable_items(item):
+    with pytest.raises(TypeError):
+        shard_of(item, 4)
+
+
+def make_command():
+
+    def f(host, log=None):
+        return list(host), [line.strip() for line in log or []]
+
+    @click.command('f')
+    @sharded()
+    @option('--host', None, {'multiple': True, 'type': str}, 'hosts')
+    @option('--log', None, INPUT_STREAM, 'a log')
+    @use_output(f)
+    def _f(output):
+        click.echo(' '.join(output[0]))
+        click.echo(' '.join(output[1]))
+
+    return _f
+
+
+def test_sharded_filters_multiple_options_and_streams(tmpdir):
+    hosts = ['host-%d' % i for i in range(20)]
+    log = tmpdir.join('log')
+    log.write(''.join('record-%d\n' % i for i in range(20)))
+    args = ['--host=%s' % host for host in hosts] + ['--log', str(log)]
+
+    runner = CliRunner()
+    result = runner.invoke(make_command(), args)
+    assert result.output.splitlines()[0].split() == hosts
+
+    seen_hosts, seen_records = [], []
+    for index in range(3):
+        result = runner.invoke(make_command(), args + [
+            '--shard-index', str(index), '--shard-count', '3'])
+        assert result.exit_code == 0, result.output
+        host_line, record_line = result.output.splitlines()
+        assert host_line.split() == [host for host in hosts
+                                     if shard_of(host, 3) == index]
+        seen_hosts.extend(host_line.split())
+        seen_records.extend(record_line.split())
+    assert sorted(seen_hosts) == sorted(hosts)
+    assert len(seen_records) == 20
+
+
+def test_sharded_leaves_chunked_streams(tmpdir):
+
+    @click.command('f')
+    @sharded()
+    @option('--log', None, InputStream(lines=False), 'a log')
+    @use_output(lambda log: b''.join(log))
+    def _f(output):
+        click.echo(output, nl=False)
+
+    log = tmpdir.join('log')
+    log.write('record\n' * 10)
+    for index in range(2):
+        result = CliRunner().invoke(_f, ['--log', str(log),
+                                         '--shard-index=%d' % index,
+                                         '--shard-count=2'])
+        assert result.exit_code == 0, result.output
+        assert result.output == 'record\n' * 10
+
+
+def test_sharded_envvars_and_validation():
+    runner = CliRunner()
+    env = {'CLICKUTIL_SHARD_INDEX': '1', 'CLICKUTIL_SHARD_COUNT': '2'}
+    hosts = ['host-%d' % i for i in range(10)]
+    result = runner.invoke(make_command(),
+                           ['--host=%s' % host for host in hosts], env=env)
+    assert result.output.split() == [host for host in hosts
+                                     if shard_of(host, 2) == 1]
+
+    for index, count in [(2, 2), (3, 1)]:
+        result = runner.invoke(make_command(), [
+            '--host=a', '--shard-index=%d' % index,
+            '--shard-count=%d' % count])
+        assert result.exit_code == 2
+        assert 'not less than --shard-count' in result.output
+
+
+def test_sharded_with_key_and_params():
+    seen = []
+
+    @sharded(params=['records'], key=lambda record: record[0])
+    def f(records, other=()):
+        seen.append((list(records), other))
+
+    ctx = click.Context(click.Command('f'))
+    with ctx:
+        f(records=[('u1', 1), ('a', 2), ('u1', 3)], other=('x', 'y'),
+          shard_index=shard_of('u1', 2), shard_count=2)
+    assert shard_of('u1', 2) != shard_of('a', 2)
+    assert seen == [([('u1', 1), ('u1', 3)], ('x', 'y'))]
+
+    with pytest.raises(click.BadParameter):
+        f(records=[], shard_index=5, shard_count=2)
+
+
+def test_sharded_filters_every_multiple_option_by_default():
+
+    def make_tagging_command(params):
+
+        @click.command('f')
+        @sharded(params=params)
+        @option('--host', None, {'multiple': True, 'type': str}, 'hosts')
+        @option('--tag', None, {'multiple': True, 'type': str}, 'tags')
+        @use_output(lambda host, tag: (host, tag))
+        def _f(output):
+            click.echo(repr(output))
+
+        return _f
+
+    hosts = ['host-%d' % i for i in range(10)]
+    tags = ['tag-%d' % i for i in range(10)]
+    args = (['--host=%s' % host for host in hosts] +
+            ['--tag=%s' % tag for tag in tags] +
+            ['--shard-index=0', '--shard-count=2'])
+
+    def shard(items):
+        return tuple(item for item in items if shard_of(item, 2) == 0)
+
+    result = CliRunner().invoke(make_tagging_command(None), args)
+    assert result.output == '%r\n' % ((shard(hosts), shard(tags)),)
+
+    # naming the work leaves settings such as tags alone
+    result = CliRunner().invoke(make_tagging_command(['host']), args)
+    assert result.output == '%r\n' % ((shard(hosts), tuple(tags)),)
@@ -0,0 +1,103 @@
+from __future__ import print_function
+
+import json
+import sys
+import textwrap
+import time
+
+import click
+from click.testing import CliRunner
+
+from ..args import option
+from ..call import use_output
+from ..command import lazy_group
+from ..timing import current, timings
+
+
+def make_command():
+
+    def f(x):
+        time.sleep(0.02)
+        return x
+
+    @click.command('f')
+    @timings()
+    @option('--x', None, {'multiple': True, 'type': int}, 'numbers')
+    @use_output(f)
+    def _f(output):
+        time.sleep(0.01)
+        click.echo(repr(output))
+
+    return _f
+
+
+def test_timings_off_by_default():
+    result = CliRunner().invoke(make_command(), ['--x', '1'])
+    assert result.exception is None
+    assert result.output.strip() == '(1,)'
+    assert current() is None
+
+
+def test_timings(tmpdir):
+    path = str(tmpdir.join('timings.jsonl'))
+    runner = CliRunner()
+    for _ in range(2):
+        result = runner.invoke(make_command(),
+                               ['--x', '1', '--timings', path])
+        assert result.exception is None
+        assert result.output.strip() == '(1,)'
+    assert current() is None
+
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 2
+    record = records[0]
+    assert record['command'] == 'f'
+    assert record['error'] is False
+    assert set(record['phases']) == set(['parse', 'call', 'print'])
+    assert record['phases']['call'] >= 0.02
+    assert record['phases']['print'] >= 0.01
+    assert record['total'] >= sum(record['phases'].values())
+
+
+def test_timings_from_envvar():
+    result = CliRunner().invoke(make_command(), ['--x', '1'],
+                                env={'CLICKUTIL_TIMINGS': '-'})
+    assert result.exception is None
+    lines = result.output.splitlines()
+    assert lines[0] == '(1,)'
+    assert json.loads(lines[1])['command'] == 'f'
+
+
+TIMED_LAZY_MODULE = textwrap.dedent("""
+    import click
+    import clickutil
+
+    @click.command()
+    @clickutil.timings()
+    def _%s():
+        pass
+""")
+
+
+def test_timings_report_imports_of_their_invocation(tmpdir, monkeypatch):
+    for name in ['a', 'b']:
+        tmpdir.join('timed_lazy_%s.py' % name).write(TIMED_LAZY_MODULE
+                                                     % name)
+        monkeypatch.delitem(sys.modules, 'timed_lazy_' + name,
+                            raising=False)
+    monkeypatch.syspath_prepend(str(tmpdir))
+
+    @lazy_group(None, {'timed_lazy_a._a': 'command a',
+                       'timed_lazy_b._b': 'command b'})
+    def _cli(): pass
+
+    runner = CliRunner()
+    imports = []
+    for name in ['a', 'b', 'a']:
+        result = runner.invoke(_cli, [name, '--timings', '-'])
+        assert result.exception is None, result.output
+        imports.append(json.loads(result.output)['imports'])
+    assert list(imports[0]) == ['timed_lazy_a']
+    assert list(imports[1]) == ['timed_lazy_b']
+    assert imports[2] == {}
@@ -0,0 +1,181 @@
+"""
+Phase-level timing instrumentation for clickutil commands.
+
+The `timings` decorator turns on timing for a command, after which the
+rest of clickutil records how long each phase of the command takes:
+  - import: importing subcommand modules of a `lazy_group`
+  - parse: click's processing and type conversion of the parameters
+  - call: the body of `call` and `use_output` targets
+  - print: `use_output` printers
+
+When timing is off, the only cost is a thread-local attribute check in
+the `call` and `use_output` wrappers.
+
+"""
+import collections
+import json
+import sys
+import threading
+import time
+
+import click
+
+from .util import mk_decorator, wraps_command
+
+
+class _Local(threading.local):
+    timings = None
+    last = None
+
+
+_local = _Local()
+
+# Lazy imports happen before a command's options are parsed, so we always
+# record them, in the `meta` of the click context, which is shared by the
+# contexts of the group and the command it invokes.
+_IMPORTS_KEY = 'clickutil.timing.imports'
+
+
+class Timings(object):
+    """
+    Accumulated seconds spent in each phase of a command.
+
+    """
+
+    def __init__(self):
+        self.phases = collections.OrderedDict()
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+def current():
+    """
+    Return the `Timings` of the command being timed in this thread, or
+    None if timing is off.
+
+    """
+    return _local.timings
+
+
+def last():
+    """
+    Return the `Timings` of the last command timed in this thread, after
+    it finished (or raised), or None.
+
+    """
+    return _local.last
+
+
+def timed(phase, f, args=(), kwargs=None):
+    """
+    Call `f(*args, **kwargs)`, adding the time it takes to `phase`
+    of the current `Timings`, if any.
+
+    """
+    start = time.perf_counter()
+    try:
+        return f(*args, **(kwargs or {}))
+    finally:
+        timings = _local.timings
+        if timings is not None:
+            timings.add(phase, time.perf_counter() - start)
+
+
+def record_import(module_name, seconds):
+    """
+    Record how long it took to import `module_name`, to report with the
+    command invoked in the current click context, if it is timed.
+
+    """
+    ctx = click.get_current_context(silent=True)
+    if ctx is not None:
+        imports = ctx.meta.setdefault(_IMPORTS_KEY,
+                                      collections.OrderedDict())
+        imports[module_name] = seconds
+
+
+def timings(flag='--timings', envvar='CLICKUTIL_TIMINGS'):
+    """
+    Add an option to time each phase of the command, and write the
+    results as a single JSON line to the given file (appending), or to
+    stderr if the file is `-`. The option can also be set with an
+    environment variable.
+
+    The JSON object has the `command` path, the seconds spent in each
+    phase under `phases`, the seconds spent importing each module lazily
+    loaded for this invocation under `imports`, the `total` seconds since
+    parameter processing started, and whether the command raised an
+    `error`.
+
+    The decorator should be placed directly below the click command
+    decorator, so that its option is processed first.
+
+    PARAMETERS
+    ----------
+    flag : str
+        The flag used to pass the timings file.
+    envvar : {str, None}
+        Environment variable which sets the timings file when the flag
+        is not given.
+
+    """
+    varname = flag.strip('-').replace('-', '_')
+
+    def decorator(f):
+
+        @mk_decorator(click.option(
+            flag, type=str, default=None, envvar=envvar, is_eager=True,
+            callback=_start_timing, metavar='PATH',
+            help='append phase timings as a JSON line to PATH '
+                 '("-" for stderr)'
+        ))
+        @wraps_command(f)
+        def wrapped(*args, **kwargs):
+            timing_info = kwargs.pop(varname)
+            if timing_info is None:
+                return f(*args, **kwargs)
+            path, start = timing_info
+            parsed = time.perf_counter()
+            outer = _local.timings
+            if outer is not None:
+                # already timing, e.g. a line of a `batch` run
+                outer.add('parse', parsed - start)
+                return f(*args, **kwargs)
+            _local.timings = timings = Timings()
+            timings.add('parse', parsed - start)
+            error = True
+            try:
+                result = f(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                _local.timings = None
+                _local.last = timings
+                ctx = click.get_current_context()
+                _write_timings(path, {
+                    'command': ctx.command_path,
+                    'phases': timings.phases,
+                    'imports': ctx.meta.pop(_IMPORTS_KEY, {}),
+                    'total': time.perf_counter() - start,
+                    'error': error,
+                })
+
+        return wrapped
+
+    return decorator
+
+
+def _start_timing(ctx, param, path):
+    if path is None:
+        return None
+    return (path, time.perf_counter())
+
+
+def _write_timings(path, record):
+    line = json.dumps(record) + '\n'
+    if path == '-':
+        sys.stderr.write(line)
+    else:
+        with open(path, 'a') as stream:
+            stream.write(line)
@@ -1,3 +1,5 @@
+import os
+
 from .argspec import update_wrapper
 
 
@@ -15,6 +17,41 @@ def mk_decorator(click_decorator):
     """
     def decorator(f):
         wrapper = click_decorator(f)
+        # click option decorators return `f` itself, which already has
+        # its metadata (and updating a wrapt proxy from itself recurses)
+        if wrapper is not f:
+            update_wrapper(wrapper, f)
+        return wrapper
+    return decorator
+
+
+def wraps_command(f):
+    """
+    Like `argspec.wraps`, but for wrappers that declare click options of
+    their own. The wrapper gets a copy of any click params already
+    declared on `f`, so options added to the wrapper neither get
+    clobbered by nor leak back into those of `f`.
+
+    PARAMETERS
+    ----------
+    f : function
+        The function being wrapped.
+
+    """
+    def decorator(wrapper):
         update_wrapper(wrapper, f)
+        if hasattr(wrapper, '__click_params__'):
+            wrapper.__click_params__ = list(wrapper.__click_params__)
         return wrapper
     return decorator
+
+
+def user_cache_dir():
+    """
+    Return the directory clickutil caches things in by default,
+    `$XDG_CACHE_HOME/clickutil` (or `~/.cache/clickutil`).
+
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME',
+                                os.path.expanduser('~/.cache'))
+    return os.path.join(cache_home, 'clickutil')
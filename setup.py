@@ -32,7 +32,7 @@ setup(name=PACKAGE,
       classifiers=[
           'Development Status :: 3 - Alpha',
           'License :: OSI Approved :: MIT License',
-          'Programming Language :: Python :: 2.7',
+          'Programming Language :: Python :: 3',
       ],
       keywords='',
       url='https://github.com/stroxler/clickutil',
@@ -40,7 +40,7 @@ setup(name=PACKAGE,
       author_email='steven.troxler@gmail.com',
       license='MIT',
       packages=[PACKAGE],
-      install_requires=['click>=6.6', 'tdx>=0.0.2'],
+      install_requires=['click>=8.0', 'tdx>=0.0.2'],
       tests_require=['pytest'],
       include_package_data=True,
       zip_safe=False)